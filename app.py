@@ -1,10 +1,17 @@
+import asyncio
+import contextlib
+import math
+import os
+from collections import deque
 from enum import auto
 from os import sep
-from h2o_wave import Q, main, app, ui
+from h2o_wave import Q, main, app, ui, data as buffer
 from src import *
 import altair as alt
 import textwrap
 from asyncio import Future
+from functools import lru_cache
+from uuid import uuid4
 
 
 def title(day: Day):
@@ -15,6 +22,169 @@ class Tab(Enumeration):
     problem = auto()
     model = auto()
     data = auto()
+    metrics = auto()
+
+
+@attr.s
+class View:
+    """
+    The values last pushed to a client, by field, so that update
+    only sends the fields that changed and skips saving the page
+    when nothing did
+    """
+
+    # fmt:off
+    pushed : Dict[str, Any] = attr.ib(factory=dict)
+    dirty  : bool           = attr.ib(default=False)
+    # fmt:on
+
+    def changed(self, key: str, value: Any) -> bool:
+        """ Record the value for the key, returning whether it differs from the last """
+        if key in self.pushed and self.pushed[key] == value:
+            return False
+        self.pushed[key] = value
+        self.dirty = True
+        return True
+
+    def set(self, key: str, ref: Any, field: str, value: Any):
+        """ Set the field on the card reference if its value changed """
+        if self.changed(key, value):
+            setattr(ref, field, value)
+
+    async def save(self, q: Q):
+        if self.dirty:
+            await q.page.save()
+            self.dirty = False
+
+
+@attr.s
+class FairQueue:
+    """
+    A bounded queue of solves shared between sessions.
+
+    Each solve asks for the number of solver processes it will
+    use, and is admitted once that many of the `capacity`
+    processes are free.  Sessions take turns in round robin order,
+    so one session queueing many solves cannot starve the others.
+    At most `max_pending` solves wait at once, beyond that
+    `asyncio.QueueFull` is raised.
+    """
+
+    # fmt: off
+    capacity    : int = attr.ib(factory=lambda: os.cpu_count() or 1)
+    max_pending : int = attr.ib(default=64)
+    # fmt: on
+
+    def __attrs_post_init__(self):
+        self.free = self.capacity
+        self.waiting: Dict[Any, Deque[Tuple[int, asyncio.Future]]] = {}
+        # When each session with solves running or waiting was last served
+        self.served: Dict[Any, int] = {}
+        self.running: Dict[Any, int] = {}
+        self.turn = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(q) for q in self.waiting.values())
+
+    def order(self) -> List[Any]:
+        """ The waiting sessions, least recently served first """
+        return sorted(self.waiting, key=lambda s: self.served.get(s, -1))
+
+    @contextlib.asynccontextmanager
+    async def slot(self, session: Any, processes: int = 1):
+        """ Wait for the sessions turn and enough free processes """
+        if self.pending >= self.max_pending:
+            raise asyncio.QueueFull()
+
+        processes = min(max(processes, 1), self.capacity)
+        future = asyncio.get_running_loop().create_future()
+        entry = (processes, future)
+        self.waiting.setdefault(session, deque()).append(entry)
+        self.dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(session, processes)
+            else:
+                # Give up the place in line so it no longer counts as pending
+                queue = self.waiting.get(session)
+                if queue is not None and entry in queue:
+                    queue.remove(entry)
+                    if not queue:
+                        del self.waiting[session]
+                self.dispatch()
+            raise
+
+        try:
+            yield
+        finally:
+            self.release(session, processes)
+
+    def release(self, session: Any, processes: int):
+        self.free += processes
+        self.running[session] -= 1
+        if not self.running[session]:
+            del self.running[session]
+        self.dispatch()
+
+    def dispatch(self):
+        """ Admit waiting solves, one per session in turn """
+        while self.waiting:
+            session = self.order()[0]
+            queue = self.waiting[session]
+            processes, future = queue[0]
+            if not future.cancelled() and processes > self.free:
+                # Hold the head of the line so large solves are not starved
+                break
+            queue.popleft()
+            if not queue:
+                del self.waiting[session]
+            if future.cancelled():
+                continue
+            self.free -= processes
+            self.running[session] = self.running.get(session, 0) + 1
+            self.served[session] = self.turn
+            self.turn += 1
+            future.set_result(None)
+
+        # Only the sessions still in play need to remember their turn
+        for session in list(self.served):
+            if session not in self.waiting and session not in self.running:
+                del self.served[session]
+
+
+solve_queue = FairQueue()
+
+
+@attr.s
+class Decimator:
+    """
+    Thins a stream of timed points so that plotting a long solve
+    stays cheap.  A point is kept if at least `interval` seconds
+    have passed since the last one kept, and the interval doubles
+    after every `budget` points, so the number of points kept only
+    grows with the logarithm of the run time.
+    """
+
+    # fmt: off
+    budget   : int   = attr.ib(default=100)
+    interval : float = attr.ib(default=0.05)
+    last     : float = attr.ib(default=-math.inf)
+    kept     : int   = attr.ib(default=0)
+    # fmt: on
+
+    def keep(self, time: float, final: bool = False) -> bool:
+        """ Whether to keep the point at the given time, always keeping the final one """
+        if time == self.last or (not final and time - self.last < self.interval):
+            return False
+        self.last = time
+        self.kept += 1
+        if self.kept % self.budget == 0:
+            self.interval *= 2
+        return True
 
 
 @attr.s
@@ -29,6 +199,9 @@ class App(Base):
     solving : bool      = attr.ib(default=False)
     answer  : int       = attr.ib(default=0)
     solve   : Optional[Future[None]] = attr.ib(default=None)
+    session : str       = attr.ib(factory=lambda: uuid4().hex)
+    page    : int       = attr.ib(default=0)
+    view    : View      = attr.ib(factory=View)
     # fmt:on
 
     @property
@@ -61,11 +234,16 @@ def log_app(app: App):
         log.info(f"app {k}:{type(v).__name__} = {v}")
 
 
-state = App()
-
 rows = 12
 cols = 12
 
+# The most recent points the convergence chart keeps
+chart_points = 1000
+chart_fields = ["time", "value", "series"]
+
+# Input lines per page of the Data tab
+page_size = 20
+
 
 def box(x0=1, y0=1, dx=cols, dy=rows, x1=None, y1=None):
     if x1 is not None:
@@ -129,7 +307,7 @@ async def render(q: Q, app: App):
                     "processes",
                     label="Max Processes",
                     min=1,
-                    max=12,
+                    max=solve_queue.capacity,
                     value=app.opts.processes,
                     step=1,
                     tooltip="The maximum number of processes to use.  Only applicable for certain solver engines.",
@@ -150,52 +328,166 @@ async def render(q: Q, app: App):
         ),
     )
 
+    # The spec is serialized once, solves only append to the card data
     c = (
-        alt.Chart(alt.InlineData(values=[dict(x=1, y=1)]))
-        .mark_line()
-        .encode(x="x:Q", y="y:Q")
+        alt.Chart(alt.InlineData(values=[]))
+        .mark_line(interpolate="step-after", point=True)
+        .encode(
+            x=alt.X("time:Q", title="Elapsed (s)"),
+            y=alt.Y("value:Q", title="Objective", scale=alt.Scale(zero=False)),
+            color=alt.Color("series:N", title=None),
+        )
         .properties(width="container", height="container")
         .interactive()
         .to_json()
     )
+    q.page.add("main", ui.form_card(box(3, 2, 5), items=[tabs(app), ui.text_m("")]))
     q.page.add(
-        "main",
-        ui.form_card(
-            box(3, 2, 5),
-            items=[
-                ui.tabs(
-                    "tab",
-                    items=[
-                        ui.tab("problem", "Problem", icon="Info"),
-                        ui.tab("model", "Model", icon="Code"),
-                        ui.tab("data", "Data", icon="Database"),
-                    ],
-                    value="problem",
-                ),
-                ui.text_m(""),
-            ],
+        "viz",
+        ui.vega_card(
+            box=box(8, 2, 5),
+            title="Convergence",
+            specification=c,
+            data=buffer(chart_fields, size=-chart_points),
         ),
     )
-    q.page.add("viz", ui.vega_card(box=box(8, 2, 5), title="Viz", specification=c))
     await q.page.save()
 
 
+def tabs(app: App):
+    return ui.tabs(
+        "tab",
+        items=[
+            ui.tab("problem", "Problem", icon="Info"),
+            ui.tab("model", "Model", icon="Code"),
+            ui.tab("data", "Data", icon="Database"),
+            ui.tab("metrics", "Metrics", icon="BarChart4"),
+        ],
+        value=app.tab.name,
+    )
+
+
+@lru_cache(maxsize=64)
+def tab_text(day_num: int, part_num: int, tab: Tab) -> str:
+    """ The content of the Problem or Model tab, shared by all clients """
+    day = Day.s[day_num - 1]
+    part = day.part_1 if part_num == 1 else day.part_2
+
+    if tab == Tab.problem:
+        wrapper = textwrap.TextWrapper(
+            width=80, break_long_words=False, replace_whitespace=False
+        )
+        txt = f"## Part 1\n\n" + day.part_1.blurb
+        if part_num == 2:
+            txt += f"\n\n## Part 2\n\n{day.part_2.blurb}"
+
+        text = textwrap.dedent(txt)
+        return "\n".join(wrapper.wrap(text))
+
+    return part.model
+
+
+def metrics_text() -> str:
+    table = ["| metric | labels | count | mean | p50 | p90 | max |", "|---" * 7 + "|"]
+    for name, series in metrics.to_json().items():
+        for s in series:
+            labels = ", ".join(f"{k}={v}" for k, v in s["labels"].items())
+            stats = [s["mean"], s["p50"], s["p90"], s["max"]]
+            cells = " | ".join(f"{v:.4g}" for v in stats)
+            table.append(f"| {name} | {labels} | {s['count']} | {cells} |")
+    return "\n".join(table) + f"\n\n```\n{metrics.to_prometheus()}```"
+
+
+def data_items(app: App) -> List:
+    """ One page of the input as a table, with buttons to move between pages """
+    lines = app.day.lines
+    pages = max(1, math.ceil(len(lines) / page_size))
+    app.page = min(max(app.page, 0), pages - 1)
+    start = app.page * page_size
+    stop = min(start + page_size, len(lines))
+
+    return [
+        ui.table(
+            "input",
+            columns=[
+                ui.table_column("line", "#", max_width="60"),
+                ui.table_column("text", "Input"),
+            ],
+            rows=[
+                ui.table_row(str(i), [str(i + 1), lines[i]]) for i in range(start, stop)
+            ],
+        ),
+        ui.text_s(f"Lines {start + 1} to {stop} of {len(lines)}"),
+        ui.buttons(
+            [
+                ui.button("prev", "Previous", disabled=app.page == 0),
+                ui.button("next", "Next", disabled=app.page == pages - 1),
+            ]
+        ),
+    ]
+
+
 async def solvex(q: Q, state: App, debounce=100):
 
-    lines = list(state.day.lines)
-    data = state.day.data(lines)
-    model = state.part.formulate(data)
     last = Solution()
 
-    async for sol in solutions(opts=state.opts, **model):
-        state.answer = sol.answer
-        delta = sol.iter_time.end - last.iter_time.end
-        if abs(delta.total_seconds() * 1000) >= debounce:
-            last = sol
-            await update(q, state)
+    # A portfolio runs every solver at once
+    processes = state.opts.processes
+    if state.opts.engine is Engine.PORTFOLIO:
+        processes *= len([e for e in Engine.solvers() if e.available])
+
+    # Start the chart afresh, points are appended to its cyclic buffer
+    chart = q.page["viz"]
+    chart.data = buffer(chart_fields, size=-chart_points)
+    state.view.dirty = True
+    decimator = Decimator()
+    sol = last
+
+    def plot(sol: Solution, final: bool = False):
+        t = sol.elapsed_ns / 1e9
+        if not decimator.keep(t, final):
+            return
+        if sol.answer is not None:
+            chart.data[-1] = [t, sol.answer, "objective"]
+            state.view.dirty = True
+        if sol.bound is not None:
+            chart.data[-1] = [t, sol.bound, "bound"]
+            state.view.dirty = True
+
+    try:
+        # Parsing, formulating and solving happen in a worker process
+        slot = solve_queue.slot(state.session, processes)
+        async with slot, remote_pool.lease() as worker:
+            stream = worker.solutions(state.day_num, state.part_num, state.opts)
+            try:
+                async for sol in stream:
+                    state.answer = sol.answer
+                    plot(sol)
+                    delta_ms = (sol.elapsed_ns - last.elapsed_ns) / 1e6
+                    if delta_ms >= debounce:
+                        last = sol
+                        await update(q, state)
+            finally:
+                # Cancels the solve in the worker if we stopped early
+                await stream.aclose()
+        if sol.iteration:
+            plot(sol, final=True)
+    except asyncio.QueueFull:
+        log.warning(f"solve queue full, rejecting solve for {state.session}")
+        q.page["meta"].notification = "The server is busy, please try again shortly"
+        state.view.dirty = True
+    except Exception as e:
+        # Including the worker process dying, which raises EOFError
+        log.exception("solve failed")
+        q.page["meta"].notification = f"The solve failed: {e!r}"
+        state.view.dirty = True
+    finally:
+        state.solving = False
+        state.solve = None
+        # Exported for a Prometheus textfile collector or offline analysis
+        metrics.dump(root / ".cache" / "metrics.prom")
+        metrics.dump(root / ".cache" / "metrics.json")
 
-    state.solving = False
-    state.solve = None
     await update(q, state)
 
 
@@ -205,6 +497,7 @@ async def sync(q: Q, app: App):
     """
 
     log_args(q)
+    day_num = app.day_num
 
     if q.args.day:
         app.day_num = q.args.day
@@ -218,6 +511,10 @@ async def sync(q: Q, app: App):
         app.opts.timeout = to_dur(seconds=q.args.timeout)
     if q.args.tab:
         app.tab = q.args.tab
+    if q.args.prev:
+        app.page -= 1
+    if q.args.next:
+        app.page += 1
 
     app.part_num = 1 if q.args.part == 1 else 2
 
@@ -226,6 +523,9 @@ async def sync(q: Q, app: App):
         if x.isnumeric():
             app.day_num = int(x)
 
+    if app.day_num != day_num:
+        app.page = 0
+
     if q.args.solve and not app.solving:
         app.solving = True
         task = asyncio.ensure_future(solvex(q, app))
@@ -241,58 +541,60 @@ async def sync(q: Q, app: App):
 
 
 async def update(q: Q, app: App):
+    view = app.view
+    view.set("theme", q.page["meta"], "theme", "light")
 
-    q.page["meta"].theme = "light"
     p = q.page["settings"]
-
-    p.items[0].choice_group.label = title(app.day)
-    p.items[0].choice_group.value = app.part_num
-    p.items[0].choice_group.disabled = app.solving
-
-    p.items[2].dropdown.value = app.opts.engine.name
-    p.items[2].dropdown.disabled = app.solving
-
-    p.items[4].slider.value = int(app.opts.processes)
-    p.items[4].slider.disabled = app.solving
-
-    p.items[6].slider.value = int(app.opts.timeout.total_seconds())
-    p.items[6].slider.disabled = app.solving
-
-    p.items[8].button.label = "Cancel" if app.solving else "Solve"
-
-    p = q.page["header"]
-    p.title = f"Advent of Code 2020 - Day {app.day.num} - {app.day.title}"
-
-    p = q.page["main"]
-    p.items[0].tabs.value = app.tab.name
-
-    if app.tab == Tab.problem:
-        wrapper = textwrap.TextWrapper(
-            width=80, break_long_words=False, replace_whitespace=False
-        )
-        txt = f"## Part 1\n\n" + app.part_1.blurb
-        if app.part_num == 2:
-            txt += f"\n\n## Part 2\n\n{app.part_2.blurb}"
-
-        text = textwrap.dedent(txt)
-        text = "\n".join(wrapper.wrap(text))
-
-    elif app.tab == Tab.model:
-        data = app.day.data
-        model, params = app.part.formulate(data)
-        text = model
-
+    part = p.items[0].choice_group
+    view.set("part.label", part, "label", title(app.day))
+    view.set("part.value", part, "value", app.part_num)
+    view.set("part.disabled", part, "disabled", app.solving)
+
+    engine = p.items[2].dropdown
+    view.set("engine.value", engine, "value", app.opts.engine.name)
+    view.set("engine.disabled", engine, "disabled", app.solving)
+
+    processes = p.items[4].slider
+    view.set("processes.value", processes, "value", int(app.opts.processes))
+    view.set("processes.disabled", processes, "disabled", app.solving)
+
+    timeout = p.items[6].slider
+    view.set("timeout.value", timeout, "value", int(app.opts.timeout.total_seconds()))
+    view.set("timeout.disabled", timeout, "disabled", app.solving)
+
+    label = "Cancel" if app.solving else "Solve"
+    view.set("solve.label", p.items[8].button, "label", label)
+
+    title_ = f"Advent of Code 2020 - Day {app.day.num} - {app.day.title}"
+    view.set("header.title", q.page["header"], "title", title_)
+
+    # Only rebuild the main card when what it shows has changed
+    if app.tab == Tab.data:
+        items = data_items(app)
+        shown = (app.day_num, app.tab, app.page)
+    elif app.tab == Tab.metrics:
+        text = metrics_text()
+        items = [ui.text_m(text)]
+        shown = (app.tab, text)
     else:
-        data = app.day.data
-        text = json.dumps(cattr.unstructure(data), indent=4).replace("\n", "\n\n")
+        items = None
+        shown = (app.day_num, app.part_num, app.tab)
 
-    p.items[1].text_m.content = text
+    if view.changed("main", shown):
+        if items is None:
+            items = [ui.text_m(tab_text(app.day_num, app.part_num, app.tab))]
+        q.page["main"].items = [tabs(app), *items]
 
-    await q.page.save()
+    await view.save(q)
 
 
 @app("/app")
 async def serve(q: Q):
+    # Each browser client gets its own state, solves share the solve queue
+    if q.client.state is None:
+        q.client.state = App()
+    state = q.client.state
+
     await sync(q, state)
     await render(q, state)
-    await update(q, state)
\ No newline at end of file
+    await update(q, state)
@@ -0,0 +1,272 @@
+"""
+Benchmarks for the solvers and the machinery around them
+
+    python bench.py setattr
+    python bench.py parts --sizes 100 1000 --out bench.json
+    python bench.py parts --baseline bench.json --threshold 0.2
+"""
+
+import argparse
+import platform
+import statistics
+import tempfile
+import timeit
+import tracemalloc
+
+import src.prelude as prelude
+from src import *
+
+
+def legacy_setattr(self, name: str, value: Any) -> None:
+    """ Base.__setattr__ as it was before converters were cached """
+    field = attr.fields_dict(type(self)).get(name)
+    if field and field.converter:
+        value = field.converter(value)
+    object.__setattr__(self, name, value)
+
+
+def bench_setattr(number: int):
+    """ Time attribute assignment on a Base subclass, with and without a converter """
+    opts = SolveOpts()
+    cases = [("processes", 4), ("engine", Engine.GECODE)]
+
+    def ns(f) -> float:
+        return timeit.timeit(f, number=number) / number * 1e9
+
+    print(f"{'field':<12}{'object':>12}{'legacy':>12}{'cached':>12}")
+    for name, value in cases:
+        plain = ns(lambda: object.__setattr__(opts, name, value))
+        legacy = ns(lambda: legacy_setattr(opts, name, value))
+        cached = ns(lambda: setattr(opts, name, value))
+        print(f"{name:<12}{plain:>10.0f}ns{legacy:>10.0f}ns{cached:>10.0f}ns")
+
+
+def bench_engines(names: Optional[List[str]]) -> List[Engine]:
+    """ The engines to benchmark, by default native and every installed solver """
+    if names:
+        return [Engine.parse(name) for name in names]
+    return [Engine.NATIVE] + [e for e in Engine.solvers() if e.available]
+
+
+@contextlib.contextmanager
+def replaced(name: str, value: Any):
+    """ Replace a module global of the prelude for the duration """
+    original = getattr(prelude, name)
+    setattr(prelude, name, value)
+    try:
+        yield value
+    finally:
+        setattr(prelude, name, original)
+
+
+async def bench_run(part: Part, data: Any, opts: SolveOpts) -> Dict[str, Any]:
+    """ Solve once, returning the wall time and the telemetry recorded for it """
+    labels = dict(part=part.name, engine=opts.engine.value)
+
+    with replaced("metrics", Metrics()) as registry:
+        start_ns = time.perf_counter_ns()
+        answer = await part.solve(data, opts)
+        wall = (time.perf_counter_ns() - start_ns) / 1e9
+
+    def total(name: str) -> Optional[float]:
+        hist = registry.get(name, **labels)
+        return hist and hist.sum
+
+    return dict(
+        answer=answer,
+        wall=wall,
+        flatten=total("flatten_seconds") or total("flat_seconds"),
+        solve=total("solve_seconds"),
+        rss=total("peak_rss_bytes"),
+    )
+
+
+async def bench_memory(part: Part, data: Any, opts: SolveOpts) -> int:
+    """ The peak bytes allocated by Python while solving """
+    tracemalloc.start()
+    try:
+        await part.solve(data, opts)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+async def bench_case(
+    part: Part, engine: Engine, size: int, repeat: int, timeout: int, seed: int
+) -> List[Dict[str, Any]]:
+    """
+    Benchmark the part on a generated input of the given size.
+    The cold run starts from an empty, temporary flat cache and the
+    warm runs reuse what it left behind.  Memory is measured on a
+    separate run so tracing does not skew the timings.
+    """
+    data = part.day.generate(size, seed)
+    opts = SolveOpts(engine=engine, timeout=to_dur(seconds=timeout), answer_cache=False)
+
+    with tempfile.TemporaryDirectory() as tmp, replaced(
+        "flat_cache", FlatCache(path=tmp)
+    ):
+        runs = {"cold": [await bench_run(part, data, opts)], "warm": []}
+        for _ in range(repeat):
+            runs["warm"].append(await bench_run(part, data, opts))
+        memory = await bench_memory(part, data, opts)
+
+    results = []
+    for variant, samples in runs.items():
+        walls = [s["wall"] for s in samples]
+        # Only runs that set a new lifetime peak of the solver RSS report it
+        rss = [s["rss"] for s in samples if s["rss"] is not None]
+
+        def median(key: str) -> Optional[float]:
+            values = [s[key] for s in samples if s[key] is not None]
+            return statistics.median(values) if values else None
+
+        results.append(
+            dict(
+                part=part.name,
+                engine=engine.value,
+                size=size,
+                variant=variant,
+                runs=len(samples),
+                answer=samples[-1]["answer"],
+                wall_min=min(walls),
+                wall_median=statistics.median(walls),
+                flatten=median("flatten"),
+                solve=median("solve"),
+                rss_bytes=max(rss, default=None),
+                python_peak_bytes=memory,
+            )
+        )
+    return results
+
+
+def bench_key(result: Dict[str, Any]) -> Tuple:
+    return result["part"], result["engine"], result["size"], result["variant"]
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], threshold: float
+) -> List[Dict[str, Any]]:
+    """
+    The results whose median wall time is more than `threshold`
+    slower than the baseline, with the ratio added
+    """
+    before = {bench_key(r): r for r in baseline if "error" not in r}
+    regressions = []
+    for result in results:
+        base = before.get(bench_key(result))
+        if base is None or "error" in result or not base["wall_median"]:
+            continue
+        ratio = result["wall_median"] / base["wall_median"]
+        if ratio > 1 + threshold:
+            regressions.append(dict(result, ratio=ratio))
+    return regressions
+
+
+async def bench_parts(args: argparse.Namespace) -> int:
+    """ Benchmark every registered part across engines and input sizes """
+    pattern = re.compile(args.parts or ".*")
+    results = []
+    if not args.verbose:
+        log.setLevel(logging.WARNING)
+
+    print(
+        f"{'part':<14}{'engine':<10}{'size':>8} {'variant':<6}{'median':>12}{'flatten':>12}"
+    )
+    for part in Part.s:
+        if not pattern.search(part.name):
+            continue
+        for engine in bench_engines(args.engines):
+            if engine is Engine.NATIVE and not part.native:
+                continue
+            for size in args.sizes:
+                try:
+                    case = await bench_case(
+                        part, engine, size, args.repeat, args.timeout, args.seed
+                    )
+                except NotImplementedError:
+                    log.warning(f"{part.name} has no input generator, skipping")
+                    break
+                except Exception as e:
+                    log.exception(f"{part.name} {engine.value} size={size} failed")
+                    case = [
+                        dict(
+                            part=part.name,
+                            engine=engine.value,
+                            size=size,
+                            error=repr(e),
+                        )
+                    ]
+
+                for r in case:
+                    if "error" in r:
+                        print(
+                            f"{r['part']:<14}{r['engine']:<10}{r['size']:>8} {r['error']}"
+                        )
+                        continue
+                    flatten = (
+                        "-" if r["flatten"] is None else f"{r['flatten'] * 1e3:.1f}ms"
+                    )
+                    print(
+                        f"{r['part']:<14}{r['engine']:<10}{r['size']:>8} {r['variant']:<6}"
+                        f"{r['wall_median'] * 1e3:>10.1f}ms{flatten:>12}"
+                    )
+                results += case
+
+    report = dict(
+        created=now().isoformat(),
+        python=platform.python_version(),
+        machine=platform.machine(),
+        cpus=os.cpu_count(),
+        results=results,
+    )
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+
+    if not args.baseline:
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text())["results"]
+    regressions = compare(results, baseline, args.threshold)
+    for r in regressions:
+        print(
+            f"REGRESSION {r['part']} {r['engine']} size={r['size']} "
+            f"{r['variant']} {r['ratio']:.2f}x slower"
+        )
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    setattr_ = commands.add_parser("setattr", help=bench_setattr.__doc__)
+    setattr_.add_argument("-n", "--number", type=int, default=200_000)
+
+    parts = commands.add_parser("parts", help=bench_parts.__doc__)
+    parts.add_argument("--parts", help="only parts whose name matches this regex")
+    parts.add_argument(
+        "--engines", nargs="*", help="engine names, default all available"
+    )
+    parts.add_argument("--sizes", nargs="*", type=int, default=[100, 1_000, 10_000])
+    parts.add_argument("--repeat", type=int, default=3, help="warm runs per case")
+    parts.add_argument(
+        "--timeout", type=int, default=60, help="solver timeout in seconds"
+    )
+    parts.add_argument("--seed", type=int, default=0)
+    parts.add_argument("--out", help="write the results as JSON to this path")
+    parts.add_argument(
+        "--baseline", help="compare against results from a previous --out"
+    )
+    parts.add_argument("--threshold", type=float, default=0.2, help="slowdown to flag")
+    parts.add_argument("-v", "--verbose", action="store_true", help="log each solve")
+
+    args = parser.parse_args()
+    if args.command == "setattr":
+        bench_setattr(args.number)
+    elif args.command == "parts":
+        sys.exit(asyncio.run(bench_parts(args)))
+
+
+if __name__ == "__main__":
+    main()
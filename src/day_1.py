@@ -1,3 +1,5 @@
+from itertools import combinations
+
 from .prelude import *
 
 log = setup_logger(__file__)
@@ -224,10 +226,86 @@ class Day1(Day[Data]):
     title = "Report Repair"
     input = input
 
-    @property
-    def data(self):
+    def parse(self):
         return Data([int(x) for x in self.lines])
 
+    def generate(self, size: int, seed: Optional[int] = None) -> Data:
+        """
+        Generate a report of the given size with one pair and one
+        triple of entries that sum to the target.  The remaining
+        entries are all larger than the target, so they are never
+        part of a sum.
+        """
+        if size < 5:
+            raise ValueError(
+                f"A report of {size} entries cannot hold a pair and a triple"
+            )
+
+        rng = random.Random(seed)
+        target = 2020
+        nums = [rng.randint(target + 1, target * 4) for _ in range(size)]
+        while True:
+            a = rng.randint(1, target // 2)
+            b, c = rng.randint(1, target // 3), rng.randint(1, target // 3)
+            plants = [a, target - a, b, c, target - b - c]
+            # The planted entries must not form any other sums between them
+            pairs = [xs for xs in combinations(plants, 2) if sum(xs) == target]
+            triples = [xs for xs in combinations(plants, 3) if sum(xs) == target]
+            if len(set(plants)) == 5 and len(pairs) == 1 and len(triples) == 1:
+                break
+        for i, x in zip(rng.sample(range(size), len(plants)), plants):
+            nums[i] = x
+        return Data(nums, target)
+
+
+def two_sum(nums: List[int], target: int) -> Optional[int]:
+    """
+    The largest product of two entries summing to the
+    target, found with a single pass over a hash set
+    """
+    best = None
+    seen = set()
+    for a in nums:
+        b = target - a
+        if b in seen and (best is None or a * b > best):
+            best = a * b
+        seen.add(a)
+    return best
+
+
+def three_sum(nums: List[int], target: int) -> Optional[int]:
+    """
+    The largest product of three entries summing to the
+    target, found by sorting and walking two pointers
+    inwards for each candidate first entry
+    """
+    xs = sorted(nums)
+    n = len(xs)
+    best = None
+
+    for i in range(n - 2):
+        a = xs[i]
+        if a + xs[i + 1] + xs[i + 2] > target:
+            break
+        if (i and a == xs[i - 1]) or (a + xs[-2] + xs[-1] < target):
+            continue
+
+        j, k = i + 1, n - 1
+        while j < k:
+            total = a + xs[j] + xs[k]
+            if total < target:
+                j += 1
+            elif total > target:
+                k -= 1
+            else:
+                product = a * xs[j] * xs[k]
+                if best is None or product > best:
+                    best = product
+                j += 1
+                k -= 1
+
+    return best
+
 
 class Part1(Part[Data]):
 
@@ -281,6 +359,9 @@ class Part1(Part[Data]):
     def formulate(self, data: Data):
         return self.model, dict(xs=data.nums, N=data.count, target=data.target)
 
+    def solve_native(self, data: Data) -> int:
+        return two_sum(data.nums, data.target)
+
 
 class Part2(Part[Data]):
 
@@ -318,5 +399,8 @@ class Part2(Part[Data]):
     def formulate(self, data):
         return self.model, dict(xs=data.nums, N=data.count, target=data.target)
 
+    def solve_native(self, data: Data) -> int:
+        return three_sum(data.nums, data.target)
+
 
-register(Day1, Part1, Part2)
\ No newline at end of file
+register(Day1, Part1, Part2)
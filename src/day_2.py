@@ -1,3 +1,5 @@
+from array import array
+
 from .prelude import *
 
 log = setup_logger(__name__)
@@ -1021,6 +1023,100 @@ class Data:
         return f"<{len(self.lower)} items>"
 
 
+@attr.s(repr=False)
+class Table:
+    """
+    Password policies encoded as contiguous NumPy arrays.  The
+    passwords are concatenated into a single byte buffer and
+    password i spans buffer[offsets[i]:offsets[i+1]].
+    """
+
+    lower: np.ndarray = attr.ib()
+    upper: np.ndarray = attr.ib()
+    char: np.ndarray = attr.ib()
+    buffer: np.ndarray = attr.ib()
+    offsets: np.ndarray = attr.ib()
+
+    @property
+    def n(self):
+        return len(self.char)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __repr__(self) -> str:
+        return f"<{self.n} items, {len(self.buffer)} bytes>"
+
+    @classmethod
+    def from_data(cls, data: Data) -> "Table":
+        n = data.n
+        lengths = np.fromiter(map(len, data.password), dtype=np.int64, count=n)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Offsets count characters, so each must encode to one byte
+        return cls(
+            lower=np.array(data.lower, dtype=np.uint16),
+            upper=np.array(data.upper, dtype=np.uint16),
+            char=np.frombuffer("".join(data.char).encode("ascii"), dtype=np.uint8),
+            buffer=np.frombuffer(
+                "".join(data.password).encode("ascii"), dtype=np.uint8
+            ),
+            offsets=offsets,
+        )
+
+    def counts(self) -> np.ndarray:
+        """ The number of times each policy character occurs in its password """
+        lengths = self.lengths
+        if not len(self.buffer):
+            return np.zeros(self.n, dtype=np.uint32)
+
+        matches = self.buffer == np.repeat(self.char, lengths)
+        # A sentinel so trailing empty passwords still index inside
+        matches = np.append(matches, False)
+        counts = np.add.reduceat(matches, self.offsets[:-1], dtype=np.uint32)
+        counts[lengths == 0] = 0
+        return counts
+
+    def matches(self, position: np.ndarray) -> np.ndarray:
+        """ Whether the 1-based position of each password holds its character """
+        if not len(self.buffer):
+            return np.zeros(self.n, dtype=bool)
+
+        index = self.offsets[:-1] + position.astype(np.int64) - 1
+        inside = (position >= 1) & (position <= self.lengths)
+        index = np.clip(index, 0, len(self.buffer) - 1)
+        return inside & (self.buffer[index] == self.char)
+
+
+def parse_chunk(chunk: bytes) -> Table:
+    """ Parse a chunk of complete password lines straight into a Table """
+    lower = array("H")
+    upper = array("H")
+    chars = bytearray()
+    buffer = bytearray()
+    offsets = array("q", [0])
+
+    for line in chunk.split(b"\n"):
+        if not line.strip():
+            continue
+        policy, char, password = line.split()
+        lo, hi = policy.split(b"-")
+        lower.append(int(lo))
+        upper.append(int(hi))
+        chars.append(char[0])
+        buffer += password
+        offsets.append(len(buffer))
+
+    return Table(
+        lower=np.frombuffer(lower, dtype=np.uint16),
+        upper=np.frombuffer(upper, dtype=np.uint16),
+        char=np.frombuffer(chars, dtype=np.uint8),
+        buffer=np.frombuffer(buffer, dtype=np.uint8),
+        offsets=np.frombuffer(offsets, dtype=np.int64),
+    )
+
+
 char2num = {char: i for i, char in enumerate(string.ascii_lowercase)}
 num2char = {v: k for k, v in char2num.items()}
 
@@ -1030,8 +1126,7 @@ class Day2(Day[Data]):
     title = "Password Philosophy"
     input = input
 
-    @property
-    def data(self):
+    def parse(self):
         data = Data()
         for line in self.lines:
             a, b, password = line.split()
@@ -1044,8 +1139,56 @@ class Day2(Day[Data]):
 
         return data
 
+    def stream(self, path, chunk_size: int = 1 << 20) -> Iterator[Table]:
+        """
+        Parse the password file at the given path in chunks of
+        roughly `chunk_size` bytes, yielding a Table for each so
+        memory use is bounded by the chunk size, not the file.
+        """
+        rest = b""
+        with to_file(path, must_exist=True).open("rb") as f:
+            while block := f.read(chunk_size):
+                block = rest + block
+                cut = block.rfind(b"\n") + 1
+                rest = block[cut:]
+                if cut:
+                    yield parse_chunk(block[:cut])
+
+        if rest.strip():
+            yield parse_chunk(rest)
+
+    def generate(self, size: int, seed: Optional[int] = None) -> Data:
+        """ Generate random password policies """
+        rng = random.Random(seed)
+        letters = string.ascii_lowercase[:6]
+        data = Data()
+        for _ in range(size):
+            length = rng.randint(4, 20)
+            lower = rng.randint(1, length)
+            upper = rng.randint(lower, length)
+            data.lower.append(lower)
+            data.upper.append(upper)
+            data.char.append(rng.choice(letters))
+            data.password.append("".join(rng.choices(letters, k=length)))
+        return data
+
+
+class Policy(Part[Data]):
+    """ A password policy which can be validated natively """
+
+    def validate(self, table: Table) -> int:
+        """ Count the valid passwords in the table """
+        raise NotImplementedError()
+
+    def solve_native(self, data: Data) -> int:
+        return self.validate(Table.from_data(data))
 
-class Part1(Part[Data]):
+    def solve_file(self, path, chunk_size: int = 1 << 20) -> int:
+        """ Count the valid passwords in a file, one chunk at a time """
+        return sum(self.validate(t) for t in self.day.stream(path, chunk_size))
+
+
+class Part1(Policy):
 
     blurb = r"""
     Your flight departs in a few days from the coastal airport; the easiest way down to the coast from here is via toboggan.
@@ -1124,8 +1267,13 @@ class Part1(Part[Data]):
 
         return self.model, args
 
+    def validate(self, table: Table) -> int:
+        """ Count the passwords with between lower and upper of their character """
+        counts = table.counts()
+        return int(np.count_nonzero((table.lower <= counts) & (counts <= table.upper)))
 
-class Part2(Part[Data]):
+
+class Part2(Policy):
 
     blurb = r"""
     While it appears you validated the passwords correctly, they don't seem to be what the Official Toboggan Corporate Authentication System is expecting.
@@ -1201,5 +1349,10 @@ class Part2(Part[Data]):
         )
         return self.model, args
 
+    def validate(self, table: Table) -> int:
+        """ The number of passwords with their character at exactly one position """
+        valid = table.matches(table.lower) ^ table.matches(table.upper)
+        return int(np.count_nonzero(valid))
+
 
-register(Day2, Part1, Part2)
\ No newline at end of file
+register(Day2, Part1, Part2)
@@ -327,14 +327,102 @@ input = """
 """
 
 
+Slope = Tuple[int, int]
+
+slopes: List[Slope] = [(1, 1), (3, 1), (5, 1), (7, 1), (1, 2)]
+
+
+@attr.s(repr=False)
+class Forest:
+    """
+    The map of trees as bits, eight columns packed to a byte
+    with one row of bytes per line of the map
+    """
+
+    bits: np.ndarray = attr.ib()
+    width: int = attr.ib()
+
+    @property
+    def height(self) -> int:
+        return len(self.bits)
+
+    def __repr__(self) -> str:
+        return f"<{self.height}x{self.width} forest>"
+
+    @classmethod
+    def parse(cls, lines: List[str]) -> "Forest":
+        width = len(lines[0]) if lines else 0
+        chars = np.frombuffer("".join(lines).encode(), dtype=np.uint8)
+        trees = chars.reshape(len(lines), width) == ord("#")
+        return cls(bits=np.packbits(trees, axis=1), width=width)
+
+    def is_tree(self, y: int, x: int) -> bool:
+        """ Whether there is a tree at the given position, repeating to the right """
+        x %= self.width
+        return bool((self.bits[y, x >> 3] >> (7 - (x & 7))) & 1)
+
+    def count(self, dx: int, dy: int) -> int:
+        """ The number of trees hit travelling from the top left at the given slope """
+        if dy <= 0:
+            raise ValueError(f"Slope {(dx, dy)} must move down the map, dy > 0")
+        ys = np.arange(0, self.height, dy)
+        xs = (np.arange(len(ys)) * dx) % self.width
+        hits = (self.bits[ys, xs >> 3] >> (7 - (xs & 7))) & 1
+        return int(np.count_nonzero(hits))
+
+    def count_many(self, slopes: List[Slope], cells: int = 1 << 22) -> Dict[Slope, int]:
+        """
+        The number of trees hit for each slope, computed in a single
+        sweep over the map.  Each block of rows is read once and the
+        positions of every slope that visits it are gathered together.
+        """
+        for dx, dy in slopes:
+            if dy <= 0:
+                raise ValueError(f"Slope {(dx, dy)} must move down the map, dy > 0")
+        if not self.height:
+            return {slope: 0 for slope in slopes}
+
+        groups: Dict[int, List[int]] = {}
+        for k, (_, dy) in enumerate(slopes):
+            groups.setdefault(dy, []).append(k)
+
+        dxs = np.array([dx % self.width for dx, _ in slopes], dtype=np.int32)
+        counts = np.zeros(len(slopes), dtype=np.int64)
+        block = max(1, cells // max(1, len(slopes)))
+
+        for y0 in range(0, self.height, block):
+            rows = self.bits[y0 : y0 + block]
+            for dy, ks in groups.items():
+                # The steps of these slopes which land within the block
+                first = -(-y0 // dy)
+                steps = np.arange(first, (y0 + len(rows) - 1) // dy + 1)
+                xs = (
+                    (steps % self.width).astype(np.int32) * dxs[ks][:, None]
+                ) % self.width
+                hits = rows[steps * dy - y0, xs >> 3] >> (7 - (xs & 7)).astype(np.uint8)
+                counts[ks] += np.count_nonzero(hits & 1, axis=1)
+
+        return dict(zip(slopes, counts.tolist()))
+
+    def unpack(self) -> List[List[int]]:
+        """ The map as a 0/1 matrix """
+        return np.unpackbits(self.bits, axis=1, count=self.width).tolist()
+
+
 @attr.s(kw_only=True)
 class Data:
-    map: List[List[int]] = attr.ib()
-    x1: int = attr.ib()
-    y1: int = attr.ib()
-    dx: int = attr.ib(default=1)
+    map: Forest = attr.ib()
+    dx: int = attr.ib(default=3)
     dy: int = attr.ib(default=1)
 
+    @property
+    def x1(self) -> int:
+        return self.map.width
+
+    @property
+    def y1(self) -> int:
+        return self.map.height
+
     def __str__(self) -> str:
         return f"<x1={self.x1} y1={self.y1}>"
 
@@ -344,18 +432,18 @@ class Day3(Day[Data]):
     title = "Toboggan Trajectory"
     input = input
 
-    @property
-    def data(self):
+    def parse(self):
+        return Data(map=Forest.parse(self.lines))
 
-        map = []
-        for line in self.lines:
-            row = [int(x == "#") for x in line]
-            map.append(row)
+    def trees(self, data: Data, slopes: List[Slope]) -> Dict[Slope, int]:
+        """ The number of trees hit on each of the given slopes """
+        return data.map.count_many(slopes)
 
-        y1 = len(map)
-        x1 = len(next(self.lines))
-        map = map
-        return Data(map=map, x1=x1, y1=y1)
+    def generate(self, size: int, seed: Optional[int] = None) -> Data:
+        """ Generate a random map with the given number of rows """
+        rng = np.random.default_rng(seed)
+        trees = rng.random((size, 31)) < 0.2
+        return Data(map=Forest(bits=np.packbits(trees, axis=1), width=31))
 
 
 class Part1(Part[Data]):
@@ -454,9 +542,20 @@ class Part1(Part[Data]):
         """
 
     def formulate(self, data: Data):
-        args = dict(map=data.map, x1=data.x1, y1=data.y1, dx=3, dy=1)
+        args = dict(
+            map=data.map.unpack(), x1=data.x1, y1=data.y1, dx=data.dx, dy=data.dy
+        )
         return self.model, args
 
+    async def answer(self, data: Data, opts: Arg[SolveOpts] = SolveOpts) -> int:
+        # The objective is the length of the route, not the trees hit
+        model, params = self.formulate(data)
+        sol = await solve(model, opts, **params)
+        return sol.data.answer
+
+    def solve_native(self, data: Data) -> int:
+        return data.map.count(data.dx, data.dy)
+
 
 class Part2(Part[Data]):
     blurb = """
@@ -475,19 +574,39 @@ class Part2(Part[Data]):
     What do you get if you multiply together the number of trees encountered on each of the listed slopes?
     """
 
-    async def answer(self, data, opts):
-        async def sub_problem(dx, dy):
+    # Each slope is solved with the model of part 1
+    model = Part1.model
+
+    async def trees(
+        self, data: Data, slopes: List[Slope], opts: Arg[SolveOpts] = SolveOpts
+    ) -> Dict[Slope, int]:
+        """
+        The number of trees hit on each of the given slopes.  The
+        slopes are solved concurrently, at most `opts.processes`
+        at a time with a single process each.
+        """
+        opts = arg(SolveOpts, opts)
+        if opts.engine is Engine.NATIVE:
+            return self.day.trees(data, slopes)
+
+        limit = asyncio.Semaphore(max(1, opts.processes))
+        sub_opts = attr.evolve(opts, processes=1)
+
+        async def sub_problem(slope: Slope):
+            dx, dy = slope
             data_ = attr.evolve(data, dx=dx, dy=dy)
-            answer = await self.day.part_1.solve(data=data_, opts=opts)
-            return answer
+            async with limit:
+                return await self.day.part_1.solve(data=data_, opts=sub_opts)
+
+        counts = await asyncio.gather(*[sub_problem(s) for s in slopes])
+        return dict(zip(slopes, counts))
 
-        a = await sub_problem(1, 1)
-        b = await sub_problem(3, 1)
-        c = await sub_problem(5, 1)
-        d = await sub_problem(7, 1)
-        e = await sub_problem(1, 2)
+    async def answer(self, data, opts):
+        trees = await self.trees(data, slopes, opts)
+        return math.prod(trees.values())
 
-        return a * b * c * d * e
+    def solve_native(self, data: Data) -> int:
+        return math.prod(self.day.trees(data, slopes).values())
 
 
-register(Day3, Part1, Part2)
\ No newline at end of file
+register(Day3, Part1, Part2)
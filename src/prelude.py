@@ -1,16 +1,38 @@
 import asyncio
+import bisect
+import contextlib
+import contextvars
+import dataclasses
 import datetime as dt
+import hashlib
+import math
+import multiprocessing
+import os
+import pickle
+import queue
+import random
+import re
+import shutil
+import sqlite3
 import string
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
 from functools import partial
+from multiprocessing.connection import Connection
 from pathlib import Path
 from enum import Enum
 from subprocess import call
 from typing import (
     Any,
     Callable,
+    Deque,
     Dict,
     Generator,
     Generic,
+    Iterator,
     List,
     Optional,
     Tuple,
@@ -21,9 +43,12 @@ from typing import (
 )
 
 import attr
+import minizinc
 import pendulum as pn
 import cattr
 import json
+import logging
+import numpy as np
 from logzero import setup_logger
 from minizinc import Instance, Model, Result, Solver, Status
 from pendulum import (
@@ -38,6 +63,11 @@ from pendulum import (
 )
 from pendulum.tz.timezone import UTC, Timezone
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore
+
 log = setup_logger("app")
 
 T = TypeVar("T")
@@ -289,20 +319,32 @@ E = TypeVar("E", bound="Enumeration")
 
 
 class Base:
+
+    # The converters of each class by attribute name, built on first use
+    # since attrs only decorates a class after it has been created
+    converter_tables: Dict[type, Dict[str, Callable[[Any], Any]]] = {}
+
     @classmethod
     def fields(cls):
         return attr.fields_dict(cls)
 
+    @classmethod
+    def converters(cls) -> Dict[str, Callable[[Any], Any]]:
+        table = {n: f.converter for n, f in cls.fields().items() if f.converter}
+        Base.converter_tables[cls] = table
+        return table
+
     def __setattr__(self, name: str, value: Any) -> None:
         """ Call attrs converts on setattribute """
-        field = self.fields().get(name)
-        if not field:
-            return super().__setattr__(name, value)
+        table = Base.converter_tables.get(type(self))
+        if table is None:
+            table = self.converters()
 
-        if field.converter:
-            value = field.converter(value)
+        converter = table.get(name)
+        if converter is not None:
+            value = converter(value)
 
-        return super().__setattr__(name, value)
+        return object.__setattr__(self, name, value)
 
 
 class Enumeration(Enum):
@@ -320,6 +362,76 @@ class Engine(Enumeration):
     CHUFFED = "chuffed"
     GECODE = "gecode"
     CBC = "cbc"
+    PORTFOLIO = "portfolio"
+    NATIVE = "native"
+
+    @classmethod
+    def solvers(cls) -> List["Engine"]:
+        """ The engines backed by a MiniZinc solver """
+        return [e for e in cls if e not in (Engine.PORTFOLIO, Engine.NATIVE)]
+
+    @property
+    def available(self) -> bool:
+        """ Whether the solver for this engine is installed """
+        try:
+            Solver.lookup(self.value)
+            return True
+        except (LookupError, AssertionError):
+            # minizinc asserts when no MiniZinc driver is installed at all
+            return False
+
+
+@attr.s
+class WarmStart:
+    """
+    Prior knowledge to seed a solve with: the values of a previous
+    solution as search hints, and optionally a bound the objective
+    must be no worse than.
+    """
+
+    # fmt: off
+    values : Dict[str, Any] = attr.ib(factory=dict)
+    bound  : Optional[int]  = attr.ib(default=None)
+    # fmt: on
+
+    def apply(self, model: str) -> str:
+        """ Add the warm start annotations and bound to the model """
+        values = to_values(self.values)
+        ints = {k: v for k, v in values.items() if type(v) is int}
+        bools = {k: v for k, v in values.items() if type(v) is bool}
+
+        hints = []
+        for hint in (ints, bools):
+            if hint:
+                names = ", ".join(hint)
+                vals = ", ".join(str(v).lower() for v in hint.values())
+                hints.append(f"warm_start([{names}], [{vals}])")
+
+        if hints:
+            match = re.search(
+                r"\bsolve\b(?=[^;]*\b(?:satisfy|maximize|minimize)\b)", model
+            )
+            if match:
+                annotation = "".join(f" :: {h}" for h in hints)
+                model = model[: match.end()] + annotation + model[match.end() :]
+
+        if self.bound is not None and objective(model):
+            model += bound_objective(model, self.bound)
+
+        return model
+
+
+def to_values(data: Any) -> Dict[str, Any]:
+    """ The scalar int and bool values of a solution, usable as hints """
+    if dataclasses.is_dataclass(data):
+        data = dataclasses.asdict(data)
+    if not isinstance(data, dict):
+        return {}
+    return {
+        k: v
+        for k, v in data.items()
+        if type(v) in (int, bool) and not k.startswith("_") and k != "objective"
+    }
 
 
 @attr.s
@@ -331,17 +443,26 @@ class SolveOpts(Base):
     engine       : Engine   = attr.ib(default=Engine.GECODE, converter=Engine.parse) # type: ignore
     timeout      : Duration = attr.ib(factory=to_dur, converter=to_dur)
     processes    : int      = attr.ib(default=4)
+    history      : int      = attr.ib(default=16)
+    flat_cache   : bool     = attr.ib(default=True)
+    answer_cache : bool     = attr.ib(default=True)
+    warm_start   : Optional[WarmStart] = attr.ib(default=None)
     # fmt: on
 
 
-@attr.s
-class Solution(Base):
+@attr.s(slots=True, frozen=True)
+class Solution:
+    """
+    A solution found while solving.  These are created for every
+    intermediate solution so are slotted and immutable.
+    """
 
     # fmt: off
     iteration  : int             = attr.ib(default=1)
     status     : Status          = attr.ib(default=Status.UNKNOWN)
-    total_time : Period          = attr.ib(factory=to_period)
-    iter_time  : Period          = attr.ib(factory=to_period)
+    started    : DateTime        = attr.ib(factory=now)
+    elapsed_ns : int             = attr.ib(default=0)
+    iter_ns    : int             = attr.ib(default=0)
     answer     : Optional[int]   = attr.ib(default=None)
     bound      : Optional[int]   = attr.ib(default=None)
     gap        : Optional[int]   = attr.ib(default=None)
@@ -350,8 +471,21 @@ class Solution(Base):
     rdelta     : Optional[float] = attr.ib(default=None)
     statistics : Dict[str,Any]   = attr.ib(factory=dict)
     data       : Dict[str, Any]  = attr.ib(factory=dict)
+    engine     : Optional[Engine]= attr.ib(default=None)
     # fmt: on
 
+    @property
+    def total_time(self) -> Period:
+        """ The period from the start of solving until this solution """
+        end = self.started + duration(microseconds=self.elapsed_ns // 1000)
+        return Period(self.started, end)
+
+    @property
+    def iter_time(self) -> Period:
+        """ The period from the previous solution until this one """
+        end = self.started + duration(microseconds=self.elapsed_ns // 1000)
+        return Period(end - duration(microseconds=self.iter_ns // 1000), end)
+
     def __str__(self):
         s = f"iter={self.iteration} ans={self.answer}"
         if self.bound:
@@ -359,23 +493,790 @@ class Solution(Base):
         return s
 
 
+def digest(*objs: Any) -> str:
+    """ A stable content digest of the given JSON-like objects """
+
+    h = hashlib.sha256()
+    for obj in objs:
+        text = (
+            obj
+            if isinstance(obj, str)
+            else json.dumps(obj, sort_keys=True, default=str)
+        )
+        h.update(text.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+@attr.s
+class FlatCache:
+    """
+    An on-disk cache of flattened FlatZinc models.
+
+    Entries are keyed by the model text, solver engine, a digest
+    of the data, the compiler flags and the MiniZinc and solver
+    versions.  The least recently used entries are evicted once
+    the cache grows beyond `max_bytes`, except those used within
+    the last `grace` seconds, which another solve may be about to
+    read.
+    """
+
+    # fmt: off
+    path      : Path  = attr.ib(factory=lambda: root / ".cache" / "fzn", converter=to_path)
+    max_bytes : int   = attr.ib(default=256 * 1024 ** 2)
+    grace     : float = attr.ib(default=60.0)
+    # fmt: on
+
+    versions: Dict[Any, str] = {}
+
+    def key(
+        self,
+        model: str,
+        engine: Engine,
+        data: Dict[str, Any],
+        flags: Dict[str, Any],
+        solver: Optional[Solver] = None,
+    ) -> str:
+        return digest(model, engine.value, digest(data), flags, self.toolchain(solver))
+
+    def toolchain(self, solver: Optional[Solver]) -> List[Optional[str]]:
+        """ The MiniZinc and solver versions, so an upgrade misses the cache """
+        driver = minizinc.default_driver
+        if driver is not None and driver not in self.versions:
+            self.versions[driver] = driver.minizinc_version
+        return [
+            self.versions.get(driver),
+            solver and solver.id,
+            solver and solver.version,
+        ]
+
+    def files(self, key: str) -> Tuple[Path, Path]:
+        return self.path / f"{key}.fzn", self.path / f"{key}.ozn"
+
+    def get(self, key: str) -> Optional[Tuple[Path, Path]]:
+        """ Return the cached FlatZinc and output model files, if any """
+        fzn, ozn = self.files(key)
+        try:
+            # Bump the modification time so eviction is least recently used
+            os.utime(ozn)
+            os.utime(fzn)
+        except FileNotFoundError:
+            return None
+        return fzn, ozn
+
+    def put(self, key: str, fzn: Path, ozn: Path) -> Tuple[Path, Path]:
+        """ Copy the given FlatZinc and output model files into the cache """
+        self.path.mkdir(parents=True, exist_ok=True)
+        dst_fzn, dst_ozn = self.files(key)
+        # The output model goes first, since get() looks for both
+        self.copy(ozn, dst_ozn)
+        self.copy(fzn, dst_fzn)
+        self.evict()
+        return dst_fzn, dst_ozn
+
+    def copy(self, src: Path, dst: Path):
+        # Copy under a temporary name so no reader sees a partial file
+        tmp = dst.with_name(f"{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def evict(self):
+        """ Remove the least recently used entries until under the size limit """
+        entries = []
+        for fzn in self.path.glob("*.fzn"):
+            try:
+                st = fzn.stat()
+                size = st.st_size + fzn.with_suffix(".ozn").stat().st_size
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, size, fzn))
+
+        total = sum(size for _, size, _ in entries)
+        recent = time.time() - self.grace
+        for mtime, size, fzn in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes or mtime > recent:
+                break
+            try:
+                fzn.unlink()
+                fzn.with_suffix(".ozn").unlink()
+            except OSError as e:
+                # Already evicted elsewhere, or still open on Windows
+                log.debug(f"could not evict {fzn.name}: {e}")
+                continue
+            total -= size
+            log.debug(f"evicted {fzn.name} from the flat cache")
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+flat_cache = FlatCache()
+
+
+@attr.s
+class CachedAnswer:
+    """ A previously computed answer """
+
+    # fmt: off
+    answer  : int            = attr.ib()
+    elapsed : float          = attr.ib()
+    created : float          = attr.ib()
+    values  : Dict[str, Any] = attr.ib(factory=dict, converter=lambda v: json.loads(v or "{}"))
+    # fmt: on
+
+
+@attr.s
+class AnswerCache:
+    """
+    A persistent store of answers in SQLite, keyed by the part
+    name, a digest of its modules source, a digest of the data and
+    the engine.  Entries older than `max_age` are dropped and only
+    the `max_rows` most recently used are kept.
+    """
+
+    # fmt: off
+    path     : Path     = attr.ib(factory=lambda: root / ".cache" / "answers.sqlite", converter=to_path)
+    max_rows : int      = attr.ib(default=10_000)
+    max_age  : Duration = attr.ib(factory=lambda: to_dur(days=30), converter=to_dur)
+    # fmt: on
+
+    sources: Dict[type, str] = {}
+
+    def key(self, part: "Part", data: Any, engine: Engine) -> Tuple[str, str, str, str]:
+        # The whole module, since parts solve through its helpers too
+        cls = type(part)
+        if cls not in self.sources:
+            source = Path(sys.modules[cls.__module__].__file__).read_bytes()
+            self.sources[cls] = hashlib.sha256(source).hexdigest()
+        data_digest = hashlib.sha256(pickle.dumps(data)).hexdigest()
+        return part.name, self.sources[cls], data_digest, engine.value
+
+    @contextlib.contextmanager
+    def connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    part TEXT, model TEXT, data TEXT, engine TEXT,
+                    answer INTEGER, elapsed REAL, created REAL, used REAL,
+                    solution TEXT,
+                    PRIMARY KEY (part, model, data, engine)
+                )
+                """
+            )
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: Tuple[str, str, str, str]) -> Optional[CachedAnswer]:
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT answer, elapsed, created, solution FROM answers "
+                "WHERE part=? AND model=? AND data=? AND engine=? AND created>=?",
+                (*key, time.time() - self.max_age.total_seconds()),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE answers SET used=? "
+                "WHERE part=? AND model=? AND data=? AND engine=?",
+                (time.time(), *key),
+            )
+        return CachedAnswer(*row)
+
+    def similar(self, key: Tuple[str, str, str, str]) -> Optional[CachedAnswer]:
+        """ The most recent answer with values for the same part, model and engine """
+        part, model, _, engine = key
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT answer, elapsed, created, solution FROM answers "
+                "WHERE part=? AND model=? AND engine=? AND created>=? "
+                "AND solution IS NOT NULL ORDER BY used DESC LIMIT 1",
+                (part, model, engine, time.time() - self.max_age.total_seconds()),
+            ).fetchone()
+        return None if row is None else CachedAnswer(*row)
+
+    def put(
+        self,
+        key: Tuple[str, str, str, str],
+        answer: int,
+        elapsed: float,
+        values: Optional[Dict[str, Any]] = None,
+    ):
+        stamp = time.time()
+        solution = json.dumps(values) if values else None
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(part, model, data, engine, answer, elapsed, created, used, solution) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, answer, elapsed, stamp, stamp, solution),
+            )
+            self.evict(conn)
+
+    def evict(self, conn: sqlite3.Connection):
+        """ Drop expired entries and all but the most recently used """
+        conn.execute(
+            "DELETE FROM answers WHERE created<?",
+            (time.time() - self.max_age.total_seconds(),),
+        )
+        conn.execute(
+            "DELETE FROM answers WHERE rowid NOT IN "
+            "(SELECT rowid FROM answers ORDER BY used DESC LIMIT ?)",
+            (self.max_rows,),
+        )
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+answer_cache = AnswerCache()
+
+
+@attr.s
+class Histogram:
+    """
+    A distribution of observations in cumulative buckets, as
+    Prometheus would keep it, along with the exact count, sum,
+    min and max.
+    """
+
+    # fmt: off
+    bounds : Tuple[float, ...] = attr.ib(factory=lambda: tuple(10.0 ** e for e in range(-3, 10)))
+    counts : List[int]         = attr.ib(default=None)
+    count  : int               = attr.ib(default=0)
+    sum    : float             = attr.ib(default=0.0)
+    min    : float             = attr.ib(default=math.inf)
+    max    : float             = attr.ib(default=-math.inf)
+    # fmt: on
+
+    def __attrs_post_init__(self):
+        if self.counts is None:
+            self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram"):
+        """ Add the observations of another histogram with the same bounds """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ Estimate the quantile as the upper bound of its bucket """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(
+            count=self.count,
+            sum=self.sum,
+            min=self.min if self.count else None,
+            max=self.max if self.count else None,
+            mean=self.sum / self.count if self.count else None,
+            p50=self.quantile(0.5),
+            p90=self.quantile(0.9),
+            p99=self.quantile(0.99),
+        )
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@attr.s
+class Metrics:
+    """
+    An in-process registry of solver telemetry, keyed by
+    metric name and labels, that can be dumped as JSON or
+    in the Prometheus text format.
+    """
+
+    # fmt: off
+    prefix     : str                                  = attr.ib(default="aoc")
+    histograms : Dict[str, Dict[Labels, Histogram]]   = attr.ib(factory=dict)
+    help       : Dict[str, str]                       = attr.ib(factory=dict)
+    # fmt: on
+
+    def observe(self, name: str, value: Optional[float], help: str = "", **labels):
+        if value is None or not math.isfinite(value):
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        series = self.histograms.setdefault(name, {})
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+        if help:
+            self.help.setdefault(name, help)
+
+    def merge(
+        self, histograms: Dict[str, Dict[Labels, Histogram]], help: Dict[str, str]
+    ):
+        """ Add the metrics recorded by another registry, such as a worker process's """
+        for name, series in histograms.items():
+            mine = self.histograms.setdefault(name, {})
+            for labels, hist in series.items():
+                if labels in mine:
+                    mine[labels].merge(hist)
+                else:
+                    mine[labels] = hist
+        for name, text in help.items():
+            self.help.setdefault(name, text)
+
+    def get(self, name: str, **labels) -> Optional[Histogram]:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        return self.histograms.get(name, {}).get(key)
+
+    def to_json(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {
+            name: [
+                dict(labels=dict(labels), **hist.summary())
+                for labels, hist in series.items()
+            ]
+            for name, series in self.histograms.items()
+        }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, series in self.histograms.items():
+            metric = f"{self.prefix}_{name}"
+            if name in self.help:
+                lines.append(f"# HELP {metric} {self.help[name]}")
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, hist in series.items():
+                tags = [f'{k}="{v}"' for k, v in labels]
+                cumulative = 0
+                for bound, count in zip(hist.bounds, hist.counts):
+                    cumulative += count
+                    le = ",".join(tags + [f'le="{bound:g}"'])
+                    lines.append(f"{metric}_bucket{{{le}}} {cumulative}")
+                le = ",".join(tags + ['le="+Inf"'])
+                lines.append(f"{metric}_bucket{{{le}}} {hist.count}")
+                tag = "{" + ",".join(tags) + "}" if tags else ""
+                lines.append(f"{metric}_sum{tag} {hist.sum:g}")
+                lines.append(f"{metric}_count{tag} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: Union[str, Path]):
+        """ Write the metrics to the path, as JSON if it ends in .json """
+        path = to_path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".json":
+            path.write_text(json.dumps(self.to_json(), indent=2))
+        else:
+            path.write_text(self.to_prometheus())
+
+    def clear(self):
+        self.histograms.clear()
+
+
+metrics = Metrics()
+
+# The name of the part being solved in this context, used to label metrics
+solving: contextvars.ContextVar[str] = contextvars.ContextVar("solving", default="")
+
+
+def to_seconds(value: Any) -> Optional[float]:
+    """ A statistic as seconds, whether reported as a timedelta or a number """
+    if isinstance(value, dt.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def peak_rss() -> Optional[int]:
+    """
+    The peak resident set size in bytes of any finished subprocess
+    over the life of this process, so it never goes down
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@attr.s
+class InFlight:
+    """
+    The solves running in this process.  RUSAGE_CHILDREN only has
+    the lifetime peak over all our subprocesses, so a raised peak
+    can only be credited to a solve that no other solve overlapped.
+    """
+
+    # fmt: off
+    running : int = attr.ib(default=0)
+    started : int = attr.ib(default=0)
+    # fmt: on
+
+    def enter(self) -> Optional[int]:
+        """ Start a solve, returning a token if it is the only one running """
+        self.running += 1
+        self.started += 1
+        return self.started if self.running == 1 else None
+
+    def exit(self, token: Optional[int]) -> bool:
+        """ Finish a solve, returning whether it ran alone throughout """
+        self.running -= 1
+        return token is not None and token == self.started
+
+
+in_flight = InFlight()
+
+
+def record(
+    part: str,
+    engine: Engine,
+    iterations: int,
+    wall_ns: int,
+    stats: Dict,
+    rss_before: Optional[int] = None,
+):
+    """
+    Record the telemetry of a finished solve.  The peak RSS of the
+    solver is only known when it raised the lifetime peak of our
+    subprocesses above `rss_before`, taken when the solve started,
+    so callers leave it out unless the solve ran alone.
+    """
+    labels = dict(part=part or "adhoc", engine=engine.value)
+    solve_time = to_seconds(stats.get("solveTime"))
+    if solve_time is None:
+        solve_time = wall_ns / 1e9
+    nodes = stats.get("nodes")
+
+    metrics.observe("iterations", iterations, "Solutions found per solve", **labels)
+    metrics.observe("wall_seconds", wall_ns / 1e9, "Wall time per solve", **labels)
+    metrics.observe("solve_seconds", solve_time, "Solver search time", **labels)
+    metrics.observe(
+        "flat_seconds",
+        to_seconds(stats.get("flatTime")),
+        "MiniZinc flatten time",
+        **labels,
+    )
+    if isinstance(nodes, (int, float)) and solve_time:
+        metrics.observe(
+            "nodes_per_second", nodes / solve_time, "Search throughput", **labels
+        )
+    rss = peak_rss()
+    if rss_before is not None and rss is not None and rss > rss_before:
+        metrics.observe("peak_rss_bytes", rss, "Peak solver process RSS", **labels)
+
+
+class FlatInstance(Instance):
+    """
+    An Instance that solves a cached FlatZinc file instead of
+    flattening its model again.  The original model is still
+    used for analysis (method, input and output types).
+    """
+
+    def __init__(self, solver: Solver, model: Model):
+        super().__init__(solver, model)
+        self.fzn: Optional[Path] = None
+
+    @contextlib.contextmanager
+    def files(self):
+        if self.fzn is None:
+            with super().files() as files:
+                yield files
+        else:
+            yield [self.fzn]
+
+
+def flatten(instance: Instance, key: str, flags: Dict[str, Any]) -> Tuple[Path, Path]:
+    """ Flatten the instance and store the result in the flat cache """
+    with instance.flat(**flags) as (fzn, ozn, stats):
+        log.debug(f"flattened {key[:8]} in {stats.get('flatTime')}s")
+        return flat_cache.put(key, Path(fzn.name), Path(ozn.name))
+
+
+@attr.s
+class Worker:
+    """ A slot in the solver pool holding a resolved solver configuration """
+
+    # fmt: off
+    engine : Engine = attr.ib()
+    solver : Solver = attr.ib()
+    jobs   : int    = attr.ib(default=0)
+    # fmt: on
+
+    @property
+    def healthy(self) -> bool:
+        """ Whether the solver executable can still be found """
+        exe = self.solver.executable
+        if not exe:
+            return True
+        return Path(exe).exists() or shutil.which(exe) is not None
+
+
+@attr.s
+class SolverPool:
+    """
+    A bounded pool of solver workers.
+
+    MiniZinc starts a fresh process tree for every solve, so a
+    worker is a lease on one of `size` concurrent solver slots
+    along with a solver configuration that has already been looked
+    up and health checked.  Workers are recycled after `recycle`
+    jobs so changes to the installed solvers get picked up.
+    """
+
+    # fmt: off
+    size    : int = attr.ib(factory=lambda: os.cpu_count() or 1)
+    recycle : int = attr.ib(default=100)
+    # fmt: on
+
+    def __attrs_post_init__(self):
+        self.idle: Dict[Engine, List[Worker]] = {}
+        # Semaphores belong to a loop, so one is made for each new loop
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+
+    def start(self, engine: Engine) -> Worker:
+        worker = Worker(engine=engine, solver=Solver.lookup(engine.value))
+        log.debug(f"started {engine.name} worker")
+        return worker
+
+    def warm(self, *engines: Engine):
+        """ Start a worker for each of the given engines ahead of time """
+        for engine in engines:
+            self.idle.setdefault(engine, []).append(self.start(engine))
+
+    def checkout(self, engine: Engine) -> Worker:
+        idle = self.idle.setdefault(engine, [])
+        while idle:
+            worker = idle.pop()
+            if worker.healthy:
+                return worker
+            log.warning(f"discarding unhealthy {engine.name} worker")
+        return self.start(engine)
+
+    def checkin(self, worker: Worker):
+        if worker.jobs >= self.recycle:
+            log.debug(f"recycling {worker.engine.name} worker after {worker.jobs} jobs")
+            return
+        idle = self.idle.setdefault(worker.engine, [])
+        if len(idle) < self.size:
+            idle.append(worker)
+
+    @contextlib.asynccontextmanager
+    async def lease(self, engine: Engine):
+        """ Lease a worker for the engine, waiting for a free slot """
+        loop = asyncio.get_running_loop()
+        if self.slots is None or self.loop is not loop:
+            self.loop = loop
+            self.slots = asyncio.Semaphore(self.size)
+
+        async with self.slots:
+            worker = self.checkout(engine)
+            try:
+                yield worker
+            finally:
+                worker.jobs += 1
+                self.checkin(worker)
+
+
+solver_pool = SolverPool()
+
+
+def sense(model: str) -> int:
+    """
+    The direction of the models objective, 1 if
+    maximizing, -1 if minimizing and 0 if satisfying
+    """
+    match = re.search(r"\bsolve\b[^;]*?\b(satisfy|maximize|minimize)\b", model)
+    if not match:
+        return 0
+    return dict(satisfy=0, maximize=1, minimize=-1)[match.group(1)]
+
+
+def objective(model: str) -> Optional[str]:
+    """ The expression the model optimizes, if any """
+    match = re.search(r"\bsolve\b[^;]*?\b(?:maximize|minimize)\b([^;]*);", model)
+    return match.group(1).strip() if match else None
+
+
+def bound_objective(model: str, value: int) -> str:
+    """ A constraint that the models objective is no worse than the value """
+    op = ">=" if sense(model) > 0 else "<="
+    return f"constraint ({objective(model)}) {op} {value};\n"
+
+
+def finished(sol: Solution, direction: int) -> bool:
+    """ Whether no other solver can improve on the given solution """
+    if sol.status in (
+        Status.OPTIMAL_SOLUTION,
+        Status.UNSATISFIABLE,
+        Status.ALL_SOLUTIONS,
+    ):
+        return True
+    return direction == 0 and sol.status.has_solution()
+
+
+async def portfolio(model: str, opts: SolveOpts, **kwargs):
+    """
+    Race the model on every available solver concurrently, yielding
+    each improving solution.  Once any solver proves its solution
+    optimal the others are cancelled.
+    """
+
+    engines = [e for e in Engine.solvers() if e.available]
+    if not engines:
+        raise LookupError("No solvers available for the portfolio")
+
+    direction = sense(model)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run(engine: Engine):
+        try:
+            async for sol in solutions(
+                model, attr.evolve(opts, engine=engine), **kwargs
+            ):
+                await queue.put(sol)
+        except Exception as e:
+            log.warning(f"portfolio {engine.name} failed: {e}")
+        finally:
+            await queue.put(engine)
+
+    log.info(f"portfolio of {[e.name for e in engines]}")
+    tasks = [asyncio.ensure_future(run(e)) for e in engines]
+    running = len(tasks)
+    best: Optional[Solution] = None
+    i = 0
+
+    try:
+        while running:
+            item = await queue.get()
+            if isinstance(item, Engine):
+                running -= 1
+                continue
+
+            sol: Solution = item
+            if sol.answer is None:
+                improved = best is None
+            else:
+                improved = (
+                    best is None
+                    or best.answer is None
+                    or direction * (sol.answer - best.answer) > 0
+                )
+            done = finished(sol, direction)
+            if done and sol.answer is None and not improved:
+                # Never replace an incumbent with an answer-less solution
+                log.info(f"portfolio won by {sol.engine.name}")
+                break
+            if not (improved or done):
+                continue
+
+            i += 1
+            sol = attr.evolve(sol, iteration=i)
+            best = sol
+            yield sol
+
+            if done:
+                log.info(f"portfolio won by {sol.engine.name}")
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 async def solutions(model: str, opts: Arg[SolveOpts] = SolveOpts, name="", **kwargs):
-    from math import isfinite
+    opts = arg(SolveOpts, opts)
+
+    if opts.engine is Engine.NATIVE:
+        log.warning("no native solver for a MiniZinc model, using gecode")
+        opts = attr.evolve(opts, engine=Engine.GECODE)
+
+    if opts.engine is Engine.PORTFOLIO:
+        async for sol in portfolio(model, opts, **kwargs):
+            yield sol
+        return
+
+    async with solver_pool.lease(opts.engine) as worker:
+        async for sol in solver_solutions(worker.solver, model, opts, **kwargs):
+            yield sol
+
+
+async def solver_solutions(solver: Solver, model: str, opts: SolveOpts, **kwargs):
+    """ Solve the model with the given solver, yielding each solution """
+    if opts.warm_start is not None:
+        model = opts.warm_start.apply(model)
 
     model_ = Model()
     model_.add_string(model)
 
-    opts = arg(SolveOpts, opts)
     log.info(f"solve {opts} opts")
 
-    solver = Solver.lookup(opts.engine.value)
-    instance = Instance(solver, model_)
+    if opts.flat_cache:
+        instance = FlatInstance(solver, model_)
+    else:
+        instance = Instance(solver, model_)
 
     for k, v in kwargs.items():
         instance[k] = v
 
     solver_args: Dict[str, Any] = dict(intermediate_solutions=opts.intermediate)
 
+    if opts.flat_cache:
+        # The compile time flags that solutions() would otherwise pass
+        flat_flags: Dict[str, Any] = {
+            "output-mode": "json",
+            "output-objective": True,
+            "output-output-item": True,
+        }
+        key = flat_cache.key(model, opts.engine, kwargs, flat_flags, solver)
+        files = flat_cache.get(key)
+        if files is None:
+            flat_ns = time.perf_counter_ns()
+            files = await asyncio.to_thread(flatten, instance, key, flat_flags)
+            metrics.observe(
+                "flatten_seconds",
+                (time.perf_counter_ns() - flat_ns) / 1e9,
+                "Flatten time on a flat cache miss",
+                part=solving.get() or "adhoc",
+                engine=opts.engine.value,
+            )
+        else:
+            log.debug(f"flat cache hit {key[:8]}")
+
+        instance.method  # analyse the model before switching to the FlatZinc
+        instance.fzn, ozn = files
+        solver_args["ozn-file"] = str(ozn)
+
+    async for sol in instance_solutions(instance, solver, opts, **solver_args):
+        yield sol
+
+
+async def instance_solutions(
+    instance: Instance, solver: Solver, opts: SolveOpts, **solver_args
+):
+    """ Solve the prepared instance, yielding each solution """
+    from math import isfinite
+
+    solver_args.setdefault("intermediate_solutions", opts.intermediate)
+
     if opts.timeout:
         solver_args["timeout"] = opts.timeout
 
@@ -384,8 +1285,12 @@ async def solutions(model: str, opts: Arg[SolveOpts] = SolveOpts, name="", **kwa
 
     i = 0
     last = Solution()
-    solve_start = now()
-    iter_start = solve_start
+    started = last.started
+    start_ns = time.perf_counter_ns()
+    iter_start_ns = start_ns
+    rss_before = peak_rss()
+    token = in_flight.enter()
+    stats: Dict[str, Any] = {}
 
     try:
         async for result in instance.solutions(**solver_args):
@@ -395,66 +1300,107 @@ async def solutions(model: str, opts: Arg[SolveOpts] = SolveOpts, name="", **kwa
             stats = result.statistics
 
             i += 1
-            iter_end = now()
-            total_time = pn.period(solve_start, iter_end)
-            iter_time = pn.period(iter_start, iter_end)
-            obj = objective
+            iter_end_ns = time.perf_counter_ns()
+            answer, bound, gap, rgap, delta, rdelta = objective, *[None] * 5
+
+            obj_bound = stats.get("objectiveBound", None)
+            if (obj_bound is not None) and isfinite(obj_bound) and (answer is not None):
+                bound = int(obj_bound)
+                gap = abs(answer - bound)
+                rgap = None if not bound else (gap / bound)
+                if (last.gap is not None) and (last.rgap is not None):
+                    delta = gap - last.gap
+                    rdelta = rgap - last.rgap
+
+            if not values:
+                values = last.data
+                answer = last.answer
+                gap = last.gap
+                rgap = last.rgap
+                bound = last.bound
+                delta = last.delta
+                rdelta = last.rdelta
 
             sol = Solution(
-                total_time=total_time,
-                iter_time=iter_time,
-                answer=obj,
+                started=started,
+                elapsed_ns=iter_end_ns - start_ns,
+                iter_ns=iter_end_ns - iter_start_ns,
+                answer=answer,
+                bound=bound,
+                gap=gap,
+                rgap=rgap,
+                delta=delta,
+                rdelta=rdelta,
                 status=status,
                 statistics=stats,
                 iteration=i,
                 data=values,
+                engine=opts.engine,
             )
 
-            bound = stats.get("objectiveBound", None)
-            if (bound is not None) and isfinite(bound) and (sol.answer is not None):
-                sol.bound = int(bound)
-                sol.gap = abs(sol.answer - sol.bound)
-                sol.rgap = None if not sol.bound else (sol.gap / sol.bound)
-                if (last.gap is not None) and (last.rgap is not None):
-                    sol.delta = sol.gap - last.gap
-                    sol.rdelta = sol.rgap - last.rgap
-
-            if not values:
-                sol.data = last.data
-                sol.answer = last.answer
-                sol.gap = last.gap
-                sol.rgap = last.rgap
-                sol.bound = last.bound
-                sol.delta = last.delta
-                sol.rdelta = last.rdelta
-
-            # log.error(f"{iter_time.start} {iter_time.end}")
-            # log.error(f"{total_time.start} {total_time.end}")
-            assert sol.total_time.start == solve_start
-
-            log.debug(
-                f"i={sol.iteration} obj={sol.answer} iter={to_elapsed(iter_time)} total={to_elapsed(total_time)}"
-            )
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(
+                    f"i={sol.iteration} obj={sol.answer} iter={to_elapsed(sol.iter_time)} total={to_elapsed(sol.total_time)}"
+                )
             last = sol
-            iter_start = iter_end
+            iter_start_ns = iter_end_ns
 
             yield sol
 
     except ProcessLookupError as e:
         pass
 
+    finally:
+        wall_ns = time.perf_counter_ns() - start_ns
+        if not in_flight.exit(token):
+            rss_before = None
+        record(solving.get(), opts.engine, i, wall_ns, stats, rss_before)
+
     log.info(f"solve {opts} fin")
 
 
+class SolveHandle:
+    """
+    A handle on a solve.  Iterating it yields solutions as they are
+    found, the most recent `opts.history` of which are kept so that
+    long runs use constant memory.
+    """
+
+    def __init__(self, model: str, opts: Arg[SolveOpts] = SolveOpts, **kwargs):
+        self.model = model
+        self.opts = arg(SolveOpts, opts)
+        self.params = kwargs
+        self.history: Deque[Solution] = deque(maxlen=self.opts.history)
+        self.last: Optional[Solution] = None
+
+    async def __aiter__(self):
+        async for sol in solutions(self.model, self.opts, **self.params):
+            self.last = sol
+            self.history.append(sol)
+            yield sol
+
+
+# The best solution of the most recent solve in this context,
+# and whether it was proven optimal or satisfied the model
+last_solution: contextvars.ContextVar[Optional[Solution]] = contextvars.ContextVar(
+    "last_solution", default=None
+)
+last_final: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "last_final", default=False
+)
+
+
 async def solve(model: str, opts: Arg[SolveOpts] = SolveOpts, **kwargs):
     """ Solve the given model and return the best solution """
 
-    sol = Solution()
+    handle = SolveHandle(model, opts, **kwargs)
 
-    async for sol in solutions(model, opts, **kwargs):
+    async for sol in handle:
         pass
 
-    return sol
+    last_solution.set(handle.last)
+    last_final.set(handle.last is not None and finished(handle.last, sense(model)))
+    return handle.last or Solution()
 
 
 class Day(Generic[T]):
@@ -468,14 +1414,61 @@ class Day(Generic[T]):
     part_2: "Part[T]"
     s: List["Day"] = []
 
+    # Where parsed data is pickled between runs, None to disable
+    cache_dir: Optional[Path] = root / ".cache" / "data"
+
     def __init__(self):
         self.log = setup_logger(self.name)
+        self._lines: Tuple[Optional[str], List[str]] = (None, [])
+        self._data: Tuple[Optional[str], Any] = (None, None)
+
+    def parse(self) -> T:
+        """
+        Parse the problem instance from the lines
+        of the input file
+        """
+        raise NotImplementedError()
 
     @property
     def data(self) -> T:
         """
-        Load the problem instance from the lines
-        of the input file
+        The problem instance, parsed once and cached
+        until the input changes
+        """
+        input, data = self._data
+        if input is not self.input:
+            data = self.load()
+            self._data = (self.input, data)
+        return data
+
+    def load(self) -> T:
+        """
+        Load the problem instance from the on disk cache,
+        parsing and storing it there if not present
+        """
+        if self.cache_dir is None:
+            return self.parse()
+
+        source = Path(sys.modules[type(self).__module__].__file__).read_bytes()
+        key = digest(self.input, source.decode())
+        path = self.cache_dir / f"{self.name}_{key[:16]}.pickle"
+
+        if path.exists():
+            try:
+                with path.open("rb") as f:
+                    return pickle.load(f)
+            except Exception as e:
+                self.log.warning(f"could not load cached data from {path}: {e}")
+
+        data = self.parse()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return data
+
+    def generate(self, size: int, seed: Optional[int] = None) -> T:
+        """
+        Generate a synthetic problem instance of the given size
         """
         raise NotImplementedError()
 
@@ -484,10 +1477,12 @@ class Day(Generic[T]):
         return f"day_{self.num}"
 
     @property
-    def lines(self):
-        for line in self.input.split("\n"):
-            if line:
-                yield line.strip()
+    def lines(self) -> List[str]:
+        input, lines = self._lines
+        if input is not self.input:
+            lines = [line.strip() for line in self.input.split("\n") if line]
+            self._lines = (self.input, lines)
+        return lines
 
     @property
     def parts(self):
@@ -504,6 +1499,8 @@ class Part(Generic[T]):
         self.log = setup_logger(self.name)
 
     blurb: str
+    # The MiniZinc model, before any data
+    model: str
     s: List["Part"] = []
 
     @property
@@ -514,15 +1511,26 @@ class Part(Generic[T]):
     def title(self):
         return f"{self.day.title} Part {self.num}"
 
-    def formulate(self, data: T) -> Dict[str, Any]:
+    def formulate(self, data: T) -> Tuple[str, Dict[str, Any]]:
         """
         Formulate the problem as a model to solve
         """
         raise NotImplementedError()
 
+    def solve_native(self, data: T) -> int:
+        """
+        Solve the problem directly in Python, without MiniZinc
+        """
+        raise NotImplementedError()
+
+    @property
+    def native(self) -> bool:
+        """ Whether this part provides a native solver """
+        return type(self).solve_native is not Part.solve_native
+
     async def answer(self, data: T, opts: Arg[SolveOpts] = SolveOpts) -> int:
-        model = self.formulate(data)
-        sol = await solve(opts=opts, **model)
+        model, params = self.formulate(data)
+        sol = await solve(model, opts, **params)
         return sol.answer
 
     async def solve(
@@ -532,8 +1540,53 @@ class Part(Generic[T]):
         code = f"D{self.day.num}P{self.num}"
         log.info(f"{code} solve start")
         data = data or self.day.data
-        answer = await self.answer(data, opts)
-        log.info(f"{code} returned {answer} in {to_elapsed(now() - start_time)}")
+        opts = arg(SolveOpts, opts)
+
+        key = None
+        if opts.answer_cache:
+            key = answer_cache.key(self, data, opts.engine)
+            cached = answer_cache.get(key)
+            if cached is not None:
+                log.info(f"{code} returned cached {cached.answer}")
+                return cached.answer
+
+        if (
+            key is not None
+            and opts.warm_start is None
+            and opts.engine in Engine.solvers()
+        ):
+            prior = answer_cache.similar(key)
+            if prior is not None:
+                log.info(f"{code} warm starting from a prior solution")
+                opts = attr.evolve(opts, warm_start=WarmStart(values=prior.values))
+
+        values = None
+        final = True
+        if opts.engine is Engine.NATIVE and self.native:
+            native_ns = time.perf_counter_ns()
+            answer = self.solve_native(data)
+            record(self.name, opts.engine, 1, time.perf_counter_ns() - native_ns, {})
+        else:
+            if opts.engine is Engine.NATIVE:
+                log.warning(f"{code} has no native solver, using gecode")
+                opts = attr.evolve(opts, engine=Engine.GECODE)
+            last_solution.set(None)
+            last_final.set(False)
+            token = solving.set(self.name)
+            try:
+                answer = await self.answer(data, opts)
+            finally:
+                solving.reset(token)
+            sol = last_solution.get()
+            values = sol and to_values(sol.data)
+            # An answer cut short by a timeout may be beaten by a longer solve
+            final = last_final.get()
+
+        elapsed = now() - start_time
+        if key is not None and answer is not None and final:
+            answer_cache.put(key, answer, elapsed.total_seconds(), values)
+
+        log.info(f"{code} returned {answer} in {to_elapsed(elapsed)}")
         return answer
 
 
@@ -544,4 +1597,347 @@ def register(day: Type[Day[T]], part_1: Type[Part[T]], part_2: Type[Part[T]]):
     d.part_1 = p1
     d.part_2 = p2
     Day.s.append(d)
-    Part.s += [p1, p2]
\ No newline at end of file
+    Part.s += [p1, p2]
+
+
+@attr.s
+class Job:
+    """ A part to solve for the given data and options """
+
+    # fmt: off
+    part : Part                = attr.ib()
+    data : Any                 = attr.ib(default=None)
+    opts : Optional[SolveOpts] = attr.ib(default=None)
+    # fmt: on
+
+    @property
+    def key(self) -> Tuple[str, Engine]:
+        return self.part.name, self.opts.engine
+
+
+@attr.s
+class Outcome:
+    """ The result of solving a Job """
+
+    # fmt: off
+    job     : Job                     = attr.ib()
+    answer  : Optional[int]           = attr.ib(default=None)
+    elapsed : float                   = attr.ib(default=0.0)
+    error   : Optional[BaseException] = attr.ib(default=None)
+    # fmt: on
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# Smoothed wall time in seconds of past solves by part name and engine
+runtimes: Dict[Tuple[str, Engine], float] = {}
+
+
+async def solve_many(
+    jobs: List[Union[Job, Tuple]],
+    opts: Arg[SolveOpts] = SolveOpts,
+    workers: Optional[int] = None,
+    grace: float = 5.0,
+):
+    """
+    Solve many jobs concurrently, yielding an Outcome for each as it
+    completes.  At most `workers` jobs run at once and the jobs that
+    were quickest in the past are started first.  A job is cancelled
+    once it runs `grace` seconds past its solver timeout.  Jobs
+    without options use `opts`.
+    """
+
+    opts = arg(SolveOpts, opts)
+    workers = workers or solver_pool.size
+
+    pending: List[Job] = []
+    for job in jobs:
+        job = job if isinstance(job, Job) else Job(*job)
+        if job.opts is None:
+            job = attr.evolve(job, opts=opts)
+        pending.append(job)
+
+    # Shortest expected runtime first, jobs not seen before are cheap to learn
+    pending.sort(key=lambda job: runtimes.get(job.key, 0.0))
+    pending.reverse()
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run(job: Job) -> Outcome:
+        timeout = job.opts.timeout.total_seconds()
+        start = time.perf_counter()
+        try:
+            answer = await asyncio.wait_for(
+                job.part.solve(job.data, job.opts),
+                (timeout + grace) if timeout else None,
+            )
+            outcome = Outcome(job=job, answer=answer)
+        except Exception as e:
+            log.warning(f"{job.part.name} failed: {e!r}")
+            outcome = Outcome(job=job, error=e)
+
+        outcome.elapsed = time.perf_counter() - start
+        last = runtimes.get(job.key)
+        runtimes[job.key] = (
+            outcome.elapsed if last is None else (last + outcome.elapsed) / 2
+        )
+        return outcome
+
+    async def worker():
+        while pending:
+            await results.put(await run(pending.pop()))
+
+    total = len(pending)
+    tasks = [asyncio.ensure_future(worker()) for _ in range(min(workers, total))]
+    try:
+        for _ in range(total):
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def remote_worker(conn: Connection):
+    """ The entry point of a solve worker process """
+    import src  # register the days
+
+    # Look up the installed solvers once, before the first solve
+    solver_pool.warm(*[e for e in Engine.solvers() if e.available])
+    asyncio.run(serve_remote(conn))
+
+
+async def serve_remote(conn: Connection):
+    """
+    Serve solve requests from the connection, one at a time.
+    Commands are read on a thread so a running solve can still
+    be cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+    task: Optional[asyncio.Future] = None
+
+    def read():
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                msg = ("exit",)
+            loop.call_soon_threadsafe(inbox.put_nowait, msg)
+            if msg[0] == "exit":
+                return
+
+    threading.Thread(target=read, daemon=True).start()
+
+    while True:
+        kind, *args = await inbox.get()
+        if kind == "solve":
+            task = asyncio.ensure_future(remote_solve(conn, *args))
+        elif kind == "cancel" and task is not None:
+            task.cancel()
+        elif kind == "exit":
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            return
+
+
+async def remote_solve(
+    conn: Connection,
+    day_num: int,
+    part_num: int,
+    opts: SolveOpts,
+):
+    """ Parse, formulate and solve in the worker, sending back compact tuples """
+
+    def finish(kind: str, detail: Any = None):
+        # Hand the telemetry of the solve over to the caller
+        conn.send((kind, detail, metrics.histograms, metrics.help))
+        metrics.clear()
+
+    def send(sol: Solution):
+        status = sol.status and sol.status.name
+        conn.send(
+            (
+                "sol",
+                sol.iteration,
+                sol.elapsed_ns,
+                sol.iter_ns,
+                sol.answer,
+                sol.bound,
+                sol.gap,
+                status,
+            )
+        )
+
+    try:
+        day = Day.s[day_num - 1]
+        part = day.part_1 if part_num == 1 else day.part_2
+        data = day.data
+
+        if opts.engine is Engine.NATIVE and part.native:
+            start_ns = time.perf_counter_ns()
+            answer = part.solve_native(data)
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            record(part.name, opts.engine, 1, elapsed_ns, {})
+            send(
+                Solution(
+                    status=Status.OPTIMAL_SOLUTION,
+                    elapsed_ns=elapsed_ns,
+                    iter_ns=elapsed_ns,
+                    answer=answer,
+                )
+            )
+        else:
+            solving.set(part.name)
+            model, params = part.formulate(data)
+            # The MiniZinc CLI runs every solve in a fresh process, so no
+            # model stays loaded between solves; the flat cache is what
+            # spares a re-solve of the same data from flattening again
+            async for sol in solutions(model, opts, **params):
+                send(sol)
+
+        finish("done")
+
+    except asyncio.CancelledError:
+        finish("cancelled")
+
+    except Exception as e:
+        log.exception(f"remote solve of day {day_num} part {part_num} failed")
+        finish("error", repr(e))
+
+
+class RemoteSolver:
+    """
+    A solve worker in its own process, so that parsing, formulating
+    and solving never block the event loop of the caller.  Requests
+    and results travel over a pipe, each solution as a small tuple.
+    """
+
+    def __init__(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=remote_worker, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        # Whether a cancelled solve may still send messages
+        self.unsettled = False
+        # Receives are handed to a reader thread, as in serve_remote
+        self.requests: queue.SimpleQueue = queue.SimpleQueue()
+        self.pending: Optional[Future] = None
+        threading.Thread(target=self.read, daemon=True).start()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def read(self):
+        while True:
+            future = self.requests.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.conn.recv())
+            except Exception as e:
+                future.set_exception(e)
+
+    async def recv(self) -> Tuple:
+        # A receive left behind by a cancelled caller still owns the next message
+        if self.pending is None or self.pending.cancelled():
+            self.pending = Future()
+            self.requests.put(self.pending)
+        try:
+            return await asyncio.wrap_future(self.pending)
+        finally:
+            if self.pending.done():
+                self.pending = None
+
+    async def settle(self):
+        """ Discard what remains of a cancelled solve, keeping its telemetry """
+        while self.unsettled:
+            kind, *args = await self.recv()
+            if kind != "sol":
+                self.unsettled = False
+                metrics.merge(*args[1:])
+
+    async def solutions(self, day_num: int, part_num: int, opts: SolveOpts):
+        """ Solve the part in the worker, yielding each solution """
+        await self.settle()
+        started = now()
+        self.conn.send(("solve", day_num, part_num, opts))
+        self.unsettled = True
+        try:
+            while True:
+                kind, *args = await self.recv()
+                if kind == "sol":
+                    iteration, elapsed_ns, iter_ns, answer, bound, gap, status = args
+                    yield Solution(
+                        iteration=iteration,
+                        status=Status[status] if status else Status.UNKNOWN,
+                        started=started,
+                        elapsed_ns=elapsed_ns,
+                        iter_ns=iter_ns,
+                        answer=answer,
+                        bound=bound,
+                        gap=gap,
+                        engine=opts.engine,
+                    )
+                    continue
+                self.unsettled = False
+                detail, histograms, help = args
+                metrics.merge(histograms, help)
+                if kind == "error":
+                    raise RuntimeError(detail)
+                return
+        finally:
+            if self.unsettled and self.alive:
+                self.conn.send(("cancel",))
+
+    def close(self):
+        if self.alive:
+            self.conn.send(("exit",))
+            self.process.join(5)
+        if self.alive:
+            self.process.terminate()
+        self.requests.put(None)
+        self.conn.close()
+
+
+@attr.s
+class RemotePool:
+    """ Solve workers that are kept running between solves """
+
+    # fmt: off
+    size : int = attr.ib(factory=lambda: os.cpu_count() or 1)
+    # fmt: on
+
+    def __attrs_post_init__(self):
+        self.idle: List[RemoteSolver] = []
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        worker = None
+        while self.idle and worker is None:
+            worker = self.idle.pop()
+            if not worker.alive:
+                worker.close()
+                worker = None
+        if worker is None:
+            worker = await asyncio.to_thread(RemoteSolver)
+        try:
+            yield worker
+        finally:
+            if worker.alive and len(self.idle) < self.size:
+                self.idle.append(worker)
+            else:
+                worker.close()
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+
+remote_pool = RemotePool()
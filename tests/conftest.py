@@ -10,3 +10,14 @@ def part(request):
 @pytest.fixture(params=Day.s, ids=[d.name for d in Day.s])
 def day(request):
     return request.param
+
+
+@pytest.fixture(autouse=True)
+def caches(tmp_path, monkeypatch):
+    """ Keep the answer and parsed data caches out of the working tree """
+    import src.prelude as prelude
+
+    monkeypatch.setattr(
+        prelude, "answer_cache", AnswerCache(path=tmp_path / "answers.sqlite")
+    )
+    monkeypatch.setattr(Day, "cache_dir", tmp_path / "data")
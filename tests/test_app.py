@@ -0,0 +1,83 @@
+import pytest
+
+from src.prelude import *
+
+# The app needs the Wave and Altair packages
+pytest.importorskip("h2o_wave")
+pytest.importorskip("altair")
+
+from app import Decimator, FairQueue
+
+
+@pytest.mark.asyncio
+async def test_fair_queue():
+    queue = FairQueue(capacity=4)
+    order = []
+
+    async def job(session, processes):
+        async with queue.slot(session, processes):
+            order.append(session)
+            await asyncio.sleep(0.01)
+
+    # a queues three solves, b and c one each; b and c still get a turn early
+    tasks = [job("a", 4), job("a", 4), job("a", 4), job("b", 4), job("c", 4)]
+    await asyncio.gather(*tasks)
+    assert order == ["a", "b", "c", "a", "a"]
+    assert queue.free == 4
+
+    # Small solves share the processes
+    running = []
+
+    async def small(session):
+        async with queue.slot(session, 2):
+            running.append(4 - queue.free)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(small("a"), small("b"))
+    assert running == [2, 4]
+
+    # Cancelling a waiting solve gives back its place
+    async with queue.slot("a", 4):
+        waiter = asyncio.ensure_future(job("b", 4))
+        await asyncio.sleep(0)
+        assert queue.pending == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+    assert queue.pending == 0
+    assert queue.free == 4
+
+    # A cancelled waiter behind the head of the line frees its place too
+    small = FairQueue(capacity=1, max_pending=2)
+
+    async def wait(session):
+        async with small.slot(session):
+            pass
+
+    async with small.slot("a"):
+        first = asyncio.ensure_future(wait("b"))
+        second = asyncio.ensure_future(wait("c"))
+        await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        assert small.pending == 1
+        third = asyncio.ensure_future(wait("d"))
+        await asyncio.sleep(0)
+        assert small.pending == 2
+    await asyncio.gather(first, third)
+
+    full = FairQueue(capacity=1, max_pending=0)
+    with pytest.raises(asyncio.QueueFull):
+        async with full.slot("a"):
+            pass
+
+
+def test_decimator():
+    decimator = Decimator(budget=10, interval=1.0)
+    kept = [t for t in range(1000) if decimator.keep(t)]
+    assert kept[:10] == list(range(10))
+    assert kept[10:12] == [11, 13]
+    assert len(kept) < 100
+    assert not decimator.keep(999.5)
+    assert decimator.keep(999.5, final=True)
+    assert not decimator.keep(999.5, final=True)
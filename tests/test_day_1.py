@@ -0,0 +1,44 @@
+from itertools import combinations
+
+import pytest
+
+from src.day_1 import *
+
+
+def brute(nums, target, r):
+    best = None
+    for xs in combinations(nums, r):
+        if sum(xs) == target:
+            product = 1
+            for x in xs:
+                product *= x
+            best = product if best is None else max(best, product)
+    return best
+
+
+def test_sums_match_brute_force():
+    rng = random.Random(0)
+    for _ in range(50):
+        nums = [rng.randint(1, 60) for _ in range(rng.randint(3, 25))]
+        assert two_sum(nums, 60) == brute(nums, 60, 2)
+        assert three_sum(nums, 60) == brute(nums, 60, 3)
+
+
+def test_generate():
+    day = Day1()
+    data = day.generate(100_000, seed=1)
+    assert data.count == 100_000
+    assert two_sum(data.nums, data.target) is not None
+    assert three_sum(data.nums, data.target) is not None
+
+
+def test_generate_plants_one_pair_and_triple():
+    for seed in range(20):
+        data = Day1().generate(30, seed=seed)
+        pairs = [xs for xs in combinations(data.nums, 2) if sum(xs) == data.target]
+        triples = [xs for xs in combinations(data.nums, 3) if sum(xs) == data.target]
+        assert len(pairs) == 1
+        assert len(triples) == 1
+
+    with pytest.raises(ValueError):
+        Day1().generate(4)
@@ -0,0 +1,60 @@
+import pytest
+
+from src.day_2 import *
+
+
+def test_table_matches_python():
+    data = Day2().generate(2_000, seed=0)
+    table = Table.from_data(data)
+
+    counts = [p.count(c) for c, p in zip(data.char, data.password)]
+    assert table.counts().tolist() == counts
+
+    part1 = sum(lo <= n <= hi for lo, hi, n in zip(data.lower, data.upper, counts))
+    part2 = sum(
+        (p[i - 1 : i] == c) != (p[j - 1 : j] == c)
+        for i, j, c, p in zip(data.lower, data.upper, data.char, data.password)
+    )
+    assert Part1(Day2(), 1).solve_native(data) == part1
+    assert Part2(Day2(), 2).solve_native(data) == part2
+
+
+def test_table_trailing_empty_passwords():
+    data = Data(
+        lower=[1, 1, 1], upper=[2, 2, 2], char=["b", "a", "a"], password=["ab", "", ""]
+    )
+    assert Table.from_data(data).counts().tolist() == [1, 0, 0]
+
+    empty = Data(lower=[1, 1], upper=[2, 2], char=["a", "a"], password=["", ""])
+    assert Table.from_data(empty).counts().tolist() == [0, 0]
+
+
+def test_table_rejects_non_ascii():
+    data = Data(lower=[1], upper=[2], char=["a"], password=["café"])
+    with pytest.raises(UnicodeEncodeError):
+        Table.from_data(data)
+
+
+def test_table_positions_out_of_range():
+    data = Data(lower=[1, 3], upper=[5, 9], char=["a", "b"], password=["ab", "bbb"])
+    table = Table.from_data(data)
+    assert table.matches(table.upper).tolist() == [False, False]
+    assert table.matches(table.lower).tolist() == [True, True]
+
+
+def test_stream_matches_in_memory(tmp_path):
+    day = Day2()
+    data = day.generate(5_000, seed=1)
+    path = tmp_path / "passwords.txt"
+    lines = [
+        f"{lo}-{hi} {c}: {p}"
+        for lo, hi, c, p in zip(data.lower, data.upper, data.char, data.password)
+    ]
+    path.write_text("\n".join(lines))
+
+    tables = list(day.stream(path, chunk_size=4096))
+    assert len(tables) > 1
+    assert sum(t.n for t in tables) == data.n
+
+    for part in [Part1(day, 1), Part2(day, 2)]:
+        assert part.solve_file(path, chunk_size=4096) == part.solve_native(data)
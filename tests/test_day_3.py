@@ -0,0 +1,65 @@
+import pytest
+
+from src.day_3 import *
+
+
+def test_forest_matches_lines():
+    lines = ["..##.......", "#...#...#..", ".#....#..#."]
+    forest = Forest.parse(lines)
+    assert forest.height == 3
+    assert forest.width == 11
+    for y, line in enumerate(lines):
+        for x in range(3 * forest.width):
+            assert forest.is_tree(y, x) == (line[x % forest.width] == "#")
+    assert forest.unpack() == [[int(c == "#") for c in line] for line in lines]
+
+
+def test_forest_count():
+    data = Day3().generate(1_000, seed=0)
+    forest = data.map
+    for dx, dy in [(1, 1), (3, 1), (5, 1), (7, 1), (1, 2)]:
+        expected = sum(
+            forest.is_tree(y, i * dx) for i, y in enumerate(range(0, forest.height, dy))
+        )
+        assert forest.count(dx, dy) == expected
+
+
+@pytest.mark.asyncio
+async def test_trees_concurrent(monkeypatch):
+    day = Day3()
+    part_1, part_2 = Part1(day, 1), Part2(day, 2)
+    day.part_1 = part_1
+    running = []
+    peak = []
+
+    async def solve(data, opts):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return part_1.solve_native(data)
+
+    monkeypatch.setattr(part_1, "solve", solve)
+
+    data = day.generate(100, seed=1)
+    many = [(dx, dy) for dx in range(1, 6) for dy in range(1, 4)]
+    trees = await part_2.trees(data, many, SolveOpts(processes=3))
+
+    assert max(peak) == 3
+    assert trees == {(dx, dy): data.map.count(dx, dy) for dx, dy in many}
+
+
+def test_count_many():
+    data = Day3().generate(5_000, seed=2)
+    many = [(dx, dy) for dx in range(0, 40, 3) for dy in range(1, 7)]
+    counts = data.map.count_many(many, cells=1000)
+    assert counts == {(dx, dy): data.map.count(dx, dy) for dx, dy in many}
+
+
+def test_count_rejects_upward_slopes():
+    forest = Day3().generate(10, seed=3).map
+    for dy in [0, -1]:
+        with pytest.raises(ValueError):
+            forest.count(1, dy)
+        with pytest.raises(ValueError):
+            forest.count_many([(3, 1), (1, dy)])
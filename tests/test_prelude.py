@@ -0,0 +1,541 @@
+import pytest
+
+from src.prelude import *
+
+needs_minizinc = pytest.mark.skipif(
+    not Engine.GECODE.available, reason="MiniZinc with Gecode is not installed"
+)
+
+
+def test_flat_cache_roundtrip(tmp_path):
+    cache = FlatCache(path=tmp_path / "fzn")
+    key = cache.key("var 0..1: x;", Engine.GECODE, dict(n=1), {})
+    assert cache.get(key) is None
+
+    fzn = tmp_path / "a.fzn"
+    ozn = tmp_path / "a.ozn"
+    fzn.write_text("solve satisfy;")
+    ozn.write_text("output [];")
+    cache.put(key, fzn, ozn)
+
+    fzn_, ozn_ = cache.get(key)
+    assert fzn_.read_text() == "solve satisfy;"
+    assert ozn_.read_text() == "output [];"
+
+
+def test_flat_cache_key():
+    cache = FlatCache()
+    a = cache.key("m", Engine.GECODE, dict(n=1), {})
+    assert a == cache.key("m", Engine.GECODE, dict(n=1), {})
+    assert a != cache.key("m", Engine.CHUFFED, dict(n=1), {})
+    assert a != cache.key("m", Engine.GECODE, dict(n=2), {})
+
+
+def test_flat_cache_key_versions(monkeypatch):
+    from types import SimpleNamespace
+    import minizinc
+
+    cache = FlatCache()
+    monkeypatch.setattr(cache, "versions", {})
+    old = SimpleNamespace(id="org.gecode.gecode", version="6.2.0")
+    new = SimpleNamespace(id="org.gecode.gecode", version="6.3.0")
+    args = ("m", Engine.GECODE, dict(n=1), {})
+    assert cache.key(*args, old) != cache.key(*args, new)
+
+    class Driver:
+        minizinc_version = "MiniZinc 2.5.3"
+
+    driver = Driver()
+    monkeypatch.setattr(minizinc, "default_driver", driver)
+    upgraded = cache.key(*args, old)
+    cache.versions[driver] = "MiniZinc 2.6.0"
+    assert cache.key(*args, old) != upgraded
+
+
+@needs_minizinc
+@pytest.mark.asyncio
+async def test_flat_cache_solve(tmp_path, monkeypatch):
+    import src.prelude as prelude
+
+    monkeypatch.setattr(prelude, "flat_cache", FlatCache(path=tmp_path))
+    model = "int: n; var 0..n: x; solve maximize x;"
+    opts = SolveOpts(engine=Engine.GECODE)
+
+    cold = await solve(model, opts, n=3)
+    assert len(list(tmp_path.glob("*.fzn"))) == 1
+
+    # Solved from the cached .fzn with its --ozn-file
+    warm = await solve(model, opts, n=3)
+    assert len(list(tmp_path.glob("*.fzn"))) == 1
+    assert cold.answer == warm.answer == 3
+    assert warm.status == Status.OPTIMAL_SOLUTION
+    assert warm.data.x == 3
+
+    other = await solve(model, opts, n=5)
+    assert other.answer == 5
+    assert len(list(tmp_path.glob("*.fzn"))) == 2
+
+
+def test_flat_cache_evicts_least_recently_used(tmp_path):
+    cache = FlatCache(path=tmp_path / "fzn", max_bytes=250)
+    src = tmp_path / "src"
+    src.write_text("x" * 100)
+
+    keys = [str(i) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, src, src)
+        # Make the mtimes strictly increasing
+        for f in cache.files(key):
+            os.utime(f, (i, i))
+
+    cache.put("3", src, src)
+    assert cache.get("0") is None
+    assert cache.get("3") is not None
+    assert not list(cache.path.glob("*.tmp"))
+
+
+def test_flat_cache_keeps_recently_used(tmp_path):
+    cache = FlatCache(path=tmp_path / "fzn", max_bytes=250)
+    src = tmp_path / "src"
+    src.write_text("x" * 100)
+
+    # Entries used within the grace period may still be read by a solve
+    for key in "012":
+        cache.put(key, src, src)
+    assert all(cache.get(key) is not None for key in "012")
+
+
+def test_sense():
+    assert sense("var 0..1: x; solve maximize x;") == 1
+    assert (
+        sense(
+            "var 0..1: x; solve :: int_search([x], input_order, indomain_min) minimize x;"
+        )
+        == -1
+    )
+    assert sense("var 0..1: x; solve satisfy;") == 0
+
+
+@pytest.mark.asyncio
+async def test_portfolio_cancels_losers(monkeypatch):
+    import src.prelude as prelude
+
+    cancelled = []
+
+    async def fake_solutions(model, opts, **kwargs):
+        if opts.engine is Engine.GECODE:
+            yield Solution(answer=1, status=Status.SATISFIED, engine=opts.engine)
+            await asyncio.sleep(0.01)
+            yield Solution(answer=3, status=Status.OPTIMAL_SOLUTION, engine=opts.engine)
+        else:
+            yield Solution(answer=2, status=Status.SATISFIED, engine=opts.engine)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(opts.engine)
+                raise
+
+    monkeypatch.setattr(prelude, "solutions", fake_solutions)
+    monkeypatch.setattr(prelude.Solver, "lookup", lambda name: name)
+
+    opts = SolveOpts(engine=Engine.PORTFOLIO)
+    sols = [sol async for sol in portfolio("solve maximize x;", opts)]
+
+    assert sols[-1].answer == 3
+    assert sols[-1].engine is Engine.GECODE
+    assert [s.answer for s in sols] == sorted(s.answer for s in sols)
+    assert set(cancelled) == {Engine.CHUFFED, Engine.CBC}
+
+
+@pytest.mark.asyncio
+async def test_portfolio_keeps_answers(monkeypatch):
+    import src.prelude as prelude
+
+    async def fake_solutions(model, opts, **kwargs):
+        if opts.engine is Engine.GECODE:
+            yield Solution(answer=None, status=Status.SATISFIED, engine=opts.engine)
+            await asyncio.sleep(0.01)
+            yield Solution(answer=2, status=Status.SATISFIED, engine=opts.engine)
+            await asyncio.sleep(0.01)
+            yield Solution(answer=None, status=Status.SATISFIED, engine=opts.engine)
+
+    monkeypatch.setattr(prelude, "solutions", fake_solutions)
+    monkeypatch.setattr(prelude.Solver, "lookup", lambda name: name)
+
+    opts = SolveOpts(engine=Engine.PORTFOLIO)
+    sols = [sol async for sol in portfolio("solve maximize x;", opts)]
+
+    assert [s.answer for s in sols] == [None, 2]
+
+
+def test_day_data_cached(tmp_path, monkeypatch):
+    from src.day_1 import Day1
+
+    day = Day1()
+    day.cache_dir = tmp_path
+    calls = []
+    parse = day.parse
+    monkeypatch.setattr(day, "parse", lambda: calls.append(1) or parse())
+
+    assert day.data is day.data
+    assert day.lines is day.lines
+    assert len(calls) == 1
+
+    day.input = "1\n2019"
+    assert day.data.nums == [1, 2019]
+    assert len(calls) == 2
+
+    # A fresh day loads the pickled data instead of parsing
+    fresh = Day1()
+    fresh.cache_dir = tmp_path
+    fresh.input = "1\n2019"
+    monkeypatch.setattr(fresh, "parse", lambda: calls.append(1) or parse())
+    assert fresh.data.nums == [1, 2019]
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_solver_pool(monkeypatch):
+    from minizinc import Solver as Solver_
+
+    lookups = []
+
+    def lookup(tag):
+        lookups.append(tag)
+        return Solver_(name=tag, version="1", id=tag)
+
+    monkeypatch.setattr(Solver, "lookup", lookup)
+    pool = SolverPool(size=2, recycle=3)
+    running = []
+    peak = []
+
+    async def job():
+        async with pool.lease(Engine.GECODE) as worker:
+            running.append(worker)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(worker)
+
+    await asyncio.gather(*[job() for _ in range(6)])
+
+    assert max(peak) == 2
+    # Two workers doing three jobs each, recycled at the end
+    assert len(lookups) == 2
+    assert pool.idle[Engine.GECODE] == []
+
+
+class Sleepy(Part):
+    """ A fake part that sleeps for `data` seconds """
+
+    def __init__(self, name):
+        self.num = 1
+        self.label = name
+
+    @property
+    def name(self):
+        return self.label
+
+    async def solve(self, data=None, opts=SolveOpts):
+        await asyncio.sleep(data)
+        return data
+
+
+@pytest.mark.asyncio
+async def test_solve_many(monkeypatch):
+    import src.prelude as prelude
+
+    monkeypatch.setattr(prelude, "runtimes", {})
+    slow, fast, hung = Sleepy("slow"), Sleepy("fast"), Sleepy("hung")
+    prelude.runtimes[(slow.name, Engine.GECODE)] = 1.0
+    prelude.runtimes[(fast.name, Engine.GECODE)] = 0.1
+
+    jobs = [
+        (slow, 0.05),
+        (hung, 10, SolveOpts(timeout=to_dur(seconds=0.01))),
+        (fast, 0.01),
+    ]
+    outcomes = [o async for o in solve_many(jobs, workers=1, grace=0.05)]
+
+    # Unseen parts run first, then the shortest past runtime
+    assert [o.job.part.name for o in outcomes] == ["hung", "fast", "slow"]
+    assert isinstance(outcomes[0].error, asyncio.TimeoutError)
+    assert [o.answer for o in outcomes[1:]] == [0.01, 0.05]
+    assert prelude.runtimes[(hung.name, Engine.GECODE)] > 0
+
+
+@pytest.mark.asyncio
+async def test_answer_cache(tmp_path, monkeypatch):
+    import src.prelude as prelude
+    from src.day_1 import Data
+
+    cache = AnswerCache(path=tmp_path / "answers.sqlite", max_rows=2)
+    monkeypatch.setattr(prelude, "answer_cache", cache)
+    part = Day.s[0].part_1
+    calls = []
+    native = part.solve_native
+    monkeypatch.setattr(part, "solve_native", lambda d: calls.append(d) or native(d))
+
+    data = Data([1721, 979, 366, 299, 675, 1456])
+    opts = SolveOpts(engine=Engine.NATIVE)
+    assert await part.solve(data, opts) == 514579
+    assert await part.solve(data, opts) == 514579
+    assert len(calls) == 1
+
+    # Bypassing the cache always solves
+    bypass = SolveOpts(engine=Engine.NATIVE, answer_cache=False)
+    assert await part.solve(data, bypass) == 514579
+    assert len(calls) == 2
+
+    # Only the most recently used rows are kept
+    for target in [2700, 665, 2131]:
+        await part.solve(Data(data.nums, target), opts)
+    assert cache.get(cache.key(part, data, Engine.NATIVE)) is None
+
+
+@pytest.mark.asyncio
+async def test_answer_cache_final(tmp_path, monkeypatch):
+    import src.prelude as prelude
+    from src.day_1 import Data
+
+    cache = AnswerCache(path=tmp_path / "answers.sqlite")
+    monkeypatch.setattr(prelude, "answer_cache", cache)
+    part = Day.s[0].part_1
+    monkeypatch.setattr(part, "formulate", lambda d: ("solve maximize x;", {}))
+    status = Status.SATISFIED
+
+    async def fake_solutions(model, opts, **kwargs):
+        yield Solution(status=status, answer=5)
+
+    monkeypatch.setattr(prelude, "solutions", fake_solutions)
+    data = Data([1, 2, 3], 5)
+    opts = SolveOpts(engine=Engine.GECODE)
+    key = cache.key(part, data, Engine.GECODE)
+
+    # An incumbent cut short by the timeout is not kept
+    assert await part.solve(data, opts) == 5
+    assert cache.get(key) is None
+
+    status = Status.OPTIMAL_SOLUTION
+    assert await part.solve(data, opts) == 5
+    assert cache.get(key).answer == 5
+
+
+def test_solution_times():
+    sol = Solution(elapsed_ns=3_000_000_000, iter_ns=1_000_000_000)
+    assert sol.total_time.start == sol.started
+    assert sol.total_time.in_seconds() == 3
+    assert sol.iter_time.in_seconds() == 1
+    assert sol.iter_time.end == sol.total_time.end
+
+
+@pytest.mark.asyncio
+async def test_solve_handle_history(monkeypatch):
+    import src.prelude as prelude
+
+    async def fake_solutions(model, opts, **kwargs):
+        for i in range(1, 101):
+            yield Solution(iteration=i, answer=i)
+
+    monkeypatch.setattr(prelude, "solutions", fake_solutions)
+    handle = SolveHandle("", SolveOpts(history=3))
+    sols = [sol async for sol in handle]
+
+    assert len(sols) == 100
+    assert [s.answer for s in handle.history] == [98, 99, 100]
+    assert handle.last.answer == 100
+    with pytest.raises(AttributeError):
+        handle.last.extra = 1
+
+
+def test_base_converters():
+    opts = SolveOpts()
+    opts.engine = "chuffed"
+    opts.timeout = to_dur(seconds=5)
+    opts.processes = 2
+    assert opts.engine is Engine.CHUFFED
+    assert opts.timeout == to_dur(seconds=5)
+    assert opts.processes == 2
+    assert set(Base.converter_tables[SolveOpts]) == {"engine", "timeout"}
+
+
+def test_bound_objective():
+    model = "var 1..9: a; var 1..9: b; solve maximize a*b;"
+    assert objective(model) == "a*b"
+    assert bound_objective(model, 12) == "constraint (a*b) >= 12;\n"
+    assert (
+        bound_objective("var 1..3: x; solve minimize x;", 2) == "constraint (x) <= 2;\n"
+    )
+    assert objective("solve satisfy;") is None
+
+
+def test_warm_start():
+    model = "var 0..9: x;\nvar bool: b;\nsolve maximize x;\n"
+    warm = WarmStart(values=dict(x=3, b=True, objective=3, _hidden=1), bound=3)
+    applied = warm.apply(model)
+    assert (
+        "solve :: warm_start([x], [3]) :: warm_start([b], [true]) maximize x;"
+        in applied
+    )
+    assert applied.endswith("constraint (x) >= 3;\n")
+    assert WarmStart().apply(model) == model
+
+
+def test_answer_cache_similar(tmp_path):
+    cache = AnswerCache(path=tmp_path / "answers.sqlite")
+    part = Day.s[0].part_1
+    key = ("day1_part1", "model", "data", "gecode")
+    assert cache.similar(key) is None
+
+    cache.put(key, 1, 0.1)
+    assert cache.similar(key) is None
+
+    cache.put(key, 2, 0.1, dict(x=1))
+    similar = cache.similar(("day1_part1", "model", "other", "gecode"))
+    assert similar.answer == 2
+    assert similar.values == dict(x=1)
+    assert cache.similar(("day1_part1", "model", "data", "chuffed")) is None
+
+
+def test_histogram():
+    hist = Histogram(bounds=(1, 10, 100))
+    for value in [0.5, 2, 3, 50, 500]:
+        hist.observe(value)
+    assert hist.counts == [1, 2, 1, 1]
+    assert hist.quantile(0.5) == 10
+    assert hist.quantile(1.0) == 500
+    summary = hist.summary()
+    assert summary["count"] == 5
+    assert summary["min"] == 0.5
+    assert summary["max"] == 500
+    assert Histogram().quantile(0.5) is None
+
+    other = Histogram(bounds=(1, 10, 100))
+    other.observe(0.1)
+    hist.merge(other)
+    assert hist.counts == [2, 2, 1, 1]
+    assert hist.count == 6
+    assert hist.min == 0.1
+
+
+@pytest.mark.asyncio
+async def test_metrics(monkeypatch):
+    import src.prelude as prelude
+    from src.day_1 import Data
+
+    registry = Metrics()
+    monkeypatch.setattr(prelude, "metrics", registry)
+    part = Day.s[0].part_1
+    data = Data([1721, 979, 366, 299, 675, 1456])
+    opts = SolveOpts(engine=Engine.NATIVE, answer_cache=False)
+    await part.solve(data, opts)
+    await part.solve(data, opts)
+
+    hist = registry.get("wall_seconds", part=part.name, engine="native")
+    assert hist.count == 2
+    assert registry.get("peak_rss_bytes", part=part.name, engine="native") is None
+    assert registry.to_json()["iterations"][0]["sum"] == 2
+
+    text = registry.to_prometheus()
+    assert "# TYPE aoc_wall_seconds histogram" in text
+    assert (
+        f'aoc_iterations_bucket{{engine="native",part="{part.name}",le="+Inf"}} 2'
+        in text
+    )
+    assert f'aoc_iterations_count{{engine="native",part="{part.name}"}} 2' in text
+
+
+@pytest.mark.asyncio
+async def test_remote_solver(monkeypatch):
+    import src.prelude as prelude
+
+    registry = Metrics()
+    monkeypatch.setattr(prelude, "metrics", registry)
+    pool = RemotePool(size=1)
+    part = Day.s[0].part_1
+    expected = part.solve_native(part.day.data)
+    opts = SolveOpts(engine=Engine.NATIVE, answer_cache=False)
+
+    try:
+        async with pool.lease() as worker:
+            sols = [sol async for sol in worker.solutions(1, 1, opts)]
+        assert [sol.answer for sol in sols] == [expected]
+        assert sols[0].engine is Engine.NATIVE
+
+        # Telemetry recorded in the worker is merged into the callers registry
+        assert registry.get("wall_seconds", part=part.name, engine="native").count == 1
+
+        # The worker is kept for the next solve
+        async with pool.lease() as again:
+            assert again is worker
+            sols = [sol async for sol in again.solutions(1, 2, opts)]
+        assert sols[-1].answer == Day.s[0].part_2.solve_native(part.day.data)
+    finally:
+        pool.close()
+    assert not worker.alive
+
+
+def test_answer_cache_key_module(tmp_path):
+    cache = AnswerCache(path=tmp_path / "answers.sqlite")
+    part = Day.s[0].part_1
+    source = Path(sys.modules[type(part).__module__].__file__).read_bytes()
+    key = cache.key(part, None, Engine.NATIVE)
+    # Helpers outside the part class, like two_sum, are covered by the key
+    assert key[1] == hashlib.sha256(source).hexdigest()
+    assert b"def two_sum" in source
+
+
+def test_record_peak_rss(monkeypatch):
+    import src.prelude as prelude
+
+    registry = Metrics()
+    monkeypatch.setattr(prelude, "metrics", registry)
+    monkeypatch.setattr(prelude, "peak_rss", lambda: 200)
+
+    # The lifetime peak only belongs to a solve that raised it
+    record("a", Engine.GECODE, 1, 1000, {}, rss_before=100)
+    record("b", Engine.GECODE, 1, 1000, {}, rss_before=200)
+    assert registry.get("peak_rss_bytes", part="a", engine="gecode").sum == 200
+    assert registry.get("peak_rss_bytes", part="b", engine="gecode") is None
+
+
+def test_in_flight():
+    solves = InFlight()
+
+    a = solves.enter()
+    assert solves.exit(a)
+
+    # Overlapping solves share the peak, so neither is credited with it
+    a = solves.enter()
+    b = solves.enter()
+    assert not solves.exit(b)
+    assert not solves.exit(a)
+
+    # Nor is a solve that another started and finished within
+    a = solves.enter()
+    assert not solves.exit(solves.enter())
+    assert not solves.exit(a)
+    assert solves.running == 0
+
+
+def test_solver_pool_releases_loops(monkeypatch):
+    import gc
+    import weakref
+    from types import SimpleNamespace
+    import src.prelude as prelude
+
+    solver = SimpleNamespace(executable=None)
+    monkeypatch.setattr(prelude.Solver, "lookup", lambda name: solver)
+    pool = SolverPool(size=1)
+    loops = []
+
+    async def lease():
+        loops.append(weakref.ref(asyncio.get_running_loop()))
+        async with pool.lease(Engine.GECODE):
+            pass
+
+    asyncio.run(lease())
+    asyncio.run(lease())
+    gc.collect()
+    # Only the most recent loop is still referenced
+    assert loops[0]() is None
+    assert pool.loop is loops[1]()
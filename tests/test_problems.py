@@ -7,7 +7,11 @@ log = setup_logger(__name__)
 
 @pytest.mark.asyncio
 async def test_part(part: Part):
-    sol = await part.solve()
+    sol = await part.solve(opts=SolveOpts(answer_cache=False))
+
+
+def test_model(part: Part):
+    assert "solve" in part.model
 
 
 @pytest.mark.asyncio
@@ -35,3 +39,46 @@ async def test_syntax_error():
     model = "asdf"
     with pytest.raises(Exception):
         sol = await solve(model, opts)
+
+
+examples = {
+    1: ("1721\n979\n366\n299\n675\n1456", 514579, 241861950),
+    2: ("1-3 a: abcde\n1-3 b: cdefg\n2-9 c: ccccccccc", 2, 1),
+    3: (
+        "\n".join(
+            [
+                "..##.......",
+                "#...#...#..",
+                ".#....#..#.",
+                "..#.#...#.#",
+                ".#...##..#.",
+                "..#.##.....",
+                ".#.#.#....#",
+                ".#........#",
+                "#.##...#...",
+                "#...##....#",
+                ".#..#...#.#",
+            ]
+        ),
+        7,
+        336,
+    ),
+}
+
+
+def example(day: Day):
+    """ A copy of the day using the example input from the puzzle """
+    input, *answers = examples[day.num]
+    copy = type(day)()
+    copy.input = input
+    return copy, answers
+
+
+@pytest.mark.asyncio
+async def test_native(day: Day):
+    example_day, answers = example(day)
+    data = example_day.data
+    opts = SolveOpts(engine=Engine.NATIVE, answer_cache=False)
+    for part, expected in zip(day.parts, answers):
+        assert part.native
+        assert await part.solve(data, opts) == expected